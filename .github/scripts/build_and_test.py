@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 """Build and test MonolithPy packages (any mp3XX)."""
 
+import fnmatch
+import hashlib
 import json
 import os
 import platform
@@ -8,10 +10,16 @@ import re
 import shutil
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 import urllib.error
 import urllib.request
 from pathlib import Path
 
+import tracing
+from clonetree import clone_tree, link_or_clone
+
 # Unbuffered output for CI environments
 sys.stdout.reconfigure(line_buffering=True)
 sys.stderr.reconfigure(line_buffering=True)
@@ -36,6 +44,15 @@ def get_monolithpy_executable(monolithpy_dir: Path, python_version: tuple[int, i
         return monolithpy_dir / "bin" / f"python{python_version[0]}.{python_version[1]}"
 
 
+def _read_index(pkg_dir: Path) -> dict:
+    """Return the parsed index.json of pkg_dir, or {} if missing/unreadable."""
+    try:
+        with open(pkg_dir / "index.json") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError):
+        return {}
+
+
 def get_tests_from_index(index_path: Path) -> list[str]:
     """Read test files from index.json."""
     if not index_path.exists():
@@ -59,7 +76,6 @@ def clear_pip_cache(monolithpy: Path):
 
 def purge_caches(pip_cache_dir: Path, work_dir: Path):
     """Reclaim disk between prebuild tiers."""
-    import tempfile
     if pip_cache_dir.exists():
         rmtree_force(pip_cache_dir)
     mpy_cache = Path(os.environ.get("MPY_WHEEL_CACHE_DIR",
@@ -85,28 +101,114 @@ def rmtree_force(path: Path):
     shutil.rmtree(path, onexc=on_error)
 
 
-def run_rebuild(monolithpy: Path):
-    """Run rebuildpython, ignoring errors."""
+def interpreter_root(monolithpy: Path) -> Path:
+    """Return the MonolithPy install dir for an executable from
+    get_monolithpy_executable()."""
+    return monolithpy.parent.parent if monolithpy.parent.name == "bin" else monolithpy.parent
+
+
+def installed_fingerprint(monolithpy: Path) -> str:
+    """Hash the set of distributions installed into the interpreter.
+
+    Every dist-info RECORD lists each installed file with its sha256, static
+    libraries included, so the fingerprint changes exactly when pip has
+    changed what rebuildpython would link in."""
+    root = interpreter_root(monolithpy)
+    site_dirs = {p.resolve() for pattern in ("lib/python*/site-packages", "Lib/site-packages")
+                 for p in root.glob(pattern)}
+    h = hashlib.sha256()
+    for site in sorted(site_dirs):
+        for info in sorted([*site.glob("*.dist-info"), *site.glob("*.egg-info")]):
+            h.update(info.name.encode() + b"\x00")
+            record = info / "RECORD"
+            if record.is_file():
+                h.update(hash_file(record).encode())
+    return h.hexdigest()
+
+
+_RELINK_SECONDS: list[float] = []
+
+
+def run_rebuild(monolithpy: Path, out=None) -> None:
+    """Run rebuildpython, ignoring errors.
+
+    Skipped when the installed set is unchanged since the last successful
+    relink of this interpreter; the fingerprint is kept inside the
+    interpreter dir, so re-cloning a work tree forgets it."""
+    marker = interpreter_root(monolithpy) / ".rebuildpython-fingerprint"
+    fingerprint = installed_fingerprint(monolithpy)
+    if marker.is_file() and marker.read_text() == fingerprint:
+        print("rebuildpython skipped: nothing installed since the last relink", file=out)
+        return
+    start = time.monotonic()
     try:
-        subprocess.run([str(monolithpy), "-m", "rebuildpython"],
-                       capture_output=True, check=False)
+        result = subprocess.run([str(monolithpy), "-m", "rebuildpython"],
+                                capture_output=True, check=False)
     except Exception:
-        pass
+        return
+    elapsed = time.monotonic() - start
+    _RELINK_SECONDS.append(elapsed)
+    print(f"rebuildpython took {elapsed:.1f}s", file=out)
+    if result.returncode == 0:
+        marker.write_text(fingerprint)
+
+
+_WHEEL_DIR_LOCK = threading.Lock()
+
+
+def wheels_built_from_source(report_path: Path) -> set[str] | None:
+    """Return the normalized names of every distribution that a
+    `pip install --report` run had to build from an sdist, or None if the
+    report is missing or unreadable.
+
+    Entries resolved to a .whl (from PyPI or --find-links) are left out, so
+    this is exactly the set of wheels that pip built and stored in its cache.
+    Versions are not compared: sdist metadata and wheel filenames may spell
+    the same version differently, and a job's pip cache holds one build per
+    name anyway.
+    """
+    try:
+        report = json.loads(report_path.read_text())
+    except (json.JSONDecodeError, OSError):
+        return None
+    built: set[str] = set()
+    for item in report.get("install", []):
+        url = item.get("download_info", {}).get("url", "")
+        name = item.get("metadata", {}).get("name")
+        if name and not url.endswith(".whl"):
+            built.add(normalize_pkg_name(name))
+    return built
 
 
-def collect_built_wheels(pip_cache_dir: Path, output_dir: Path):
-    """Copy wheels from pip's wheel cache to output_dir."""
+def collect_built_wheels(
+    pip_cache_dir: Path,
+    output_dir: Path,
+    out=None,
+    only: set[str] | None = None,
+) -> set[str]:
+    """Materialize wheels from pip's wheel cache into output_dir.
+
+    With `only` (see wheels_built_from_source()), just the wheels of those
+    distributions are captured; otherwise every cached wheel is.
+    Files are hardlinked or cloned rather than copied where possible.
+
+    Returns the names of the wheels that were newly captured. Holds a lock so
+    parallel builds sharing output_dir never race on the same destination."""
     wheels_subdir = pip_cache_dir / "wheels"
-    if not wheels_subdir.exists():
-        return
-    copied = 0
-    for whl in wheels_subdir.rglob("*.whl"):
-        dest = output_dir / whl.name
-        if not dest.exists():
-            shutil.copy2(whl, dest)
-            copied += 1
+    if not wheels_subdir.exists() or only == set():
+        return set()
+    copied: set[str] = set()
+    with _WHEEL_DIR_LOCK:
+        for whl in wheels_subdir.rglob("*.whl"):
+            if only is not None and normalize_pkg_name(whl.name.split("-", 1)[0]) not in only:
+                continue
+            dest = output_dir / whl.name
+            if not dest.exists():
+                link_or_clone(whl, dest)
+                copied.add(whl.name)
     if copied:
-        print(f"Captured {copied} wheel(s) from pip cache")
+        print(f"Captured {len(copied)} wheel(s) from pip cache", file=out)
+    return copied
 
 
 def normalize_pkg_name(name: str) -> str:
@@ -141,14 +243,43 @@ def build_catalog(
     return catalog
 
 
-def build_dep_graph(catalog: dict[str, Path]) -> dict[str, set[str]]:
+def select_scripts(data: dict, version: str | None) -> list[dict]:
+    """Return the index.json scripts[] entries that apply to `version`.
+
+    MonolithPy uses the first entry whose metadata.Version glob matches the
+    version being built, so that is the single entry returned. When the
+    version is unknown (lookup failed, or not a PyPI package) or no entry
+    matches, every entry is returned so callers err on the side of extra
+    edges and extra hashed files. Empty when there is no scripts[] at all.
+    """
+    scripts = data.get("scripts", [])
+    if version is not None:
+        for script in scripts:
+            pattern = script.get("metadata", {}).get("Version", "*")
+            if fnmatch.fnmatchcase(version, pattern):
+                return [script]
+    return list(scripts)
+
+
+def build_dep_graph(
+    catalog: dict[str, Path],
+    versions: dict[str, str | None] | None = None,
+    *,
+    runtime_only: bool = False,
+) -> dict[str, set[str]]:
     """Return {pip_name -> set[pip_name]} covering all direct local dependencies.
 
     Reads four fields from each index.json:
       build_requires / dist_requires  – regular pip requirement specifiers
       dependencies                    – MonolithPy mpy-dep-* packages
       build_tools                     – MonolithPy mpy-tool-* packages
+
+    For packages/ entries the fields come from the scripts[] entry selected
+    by select_scripts() for the version in `versions`. With runtime_only,
+    build_requires and build_tools are skipped, leaving the edges an install
+    of the built wheels can follow.
     """
+    versions = versions or {}
     # Normalized-name → actual pip install name (for fuzzy requirement matching)
     norm_map: dict[str, str] = {normalize_pkg_name(name): name for name in catalog}
 
@@ -163,48 +294,108 @@ def build_dep_graph(catalog: dict[str, Path]) -> dict[str, set[str]]:
                 data = json.load(f)
         except (json.JSONDecodeError, OSError):
             continue
-        # packages/ use scripts[0] format; dependencies/ and build_tools/ use top-level fields
-        scripts = data.get("scripts", [])
-        script = scripts[0] if scripts else {}
+        # packages/ use the scripts[] format; dependencies/ and build_tools/ use top-level fields
+        scripts = select_scripts(data, versions.get(pip_name)) or [{}]
 
         def add_edge(norm_target: str) -> None:
             if norm_target in norm_map and norm_map[norm_target] != pip_name:
                 graph[pip_name].add(norm_map[norm_target])
 
-        # Regular pip requirements (build_requires / dist_requires)
-        for req in (script.get("build_requires") or data.get("build_requires", [])) + \
-                   (script.get("dist_requires") or data.get("dist_requires", [])):
-            bare = re.split(r'[>=<!;\[\s,]', req.strip())[0]
-            add_edge(normalize_pkg_name(bare))
+        for script in scripts:
+            # Regular pip requirements (build_requires / dist_requires)
+            build_requires = [] if runtime_only else \
+                (script.get("build_requires") or data.get("build_requires", []))
+            for req in build_requires + \
+                       (script.get("dist_requires") or data.get("dist_requires", [])):
+                bare = re.split(r'[>=<!;\[\s,]', req.strip())[0]
+                add_edge(normalize_pkg_name(bare))
 
-        # MonolithPy dependency packages  →  "mpy-dep-{name}"
-        for dep in (script.get("dependencies") or data.get("dependencies", [])):
-            add_edge(normalize_pkg_name(f"mpy-dep-{dep}"))
+            # MonolithPy dependency packages  →  "mpy-dep-{name}"
+            for dep in (script.get("dependencies") or data.get("dependencies", [])):
+                add_edge(normalize_pkg_name(f"mpy-dep-{dep}"))
 
-        # MonolithPy build tool packages  →  "mpy-tool-{name}"
-        for tool in (script.get("build_tools") or data.get("build_tools", [])):
-            add_edge(normalize_pkg_name(f"mpy-tool-{tool}"))
+            # MonolithPy build tool packages  →  "mpy-tool-{name}"
+            for tool in [] if runtime_only else \
+                    (script.get("build_tools") or data.get("build_tools", [])):
+                add_edge(normalize_pkg_name(f"mpy-tool-{tool}"))
 
     return graph
 
 
-def get_build_files(pkg_dir: Path) -> list[Path]:
-    """Return sorted build files in pkg_dir, excluding test files."""
-    excluded = set()
-    index_path = pkg_dir / "index.json"
-    if index_path.exists():
-        try:
-            with open(index_path) as f:
-                excluded.update(json.load(f).get("tests", []))
-        except (json.JSONDecodeError, OSError):
-            pass
+def get_build_files(pkg_dir: Path, version: str | None = None) -> list[Path]:
+    """Return sorted build files in pkg_dir, excluding test files.
+
+    When index.json has scripts[], only the `files` of the entries chosen by
+    select_scripts() for `version` count, so editing numpy/2.4.6/ does not
+    invalidate a numpy 2.5.1 build. Otherwise every file in pkg_dir does."""
+    data = _read_index(pkg_dir)
+    scripts = select_scripts(data, version)
+    if scripts:
+        listed = {pkg_dir / name for script in scripts for name in script.get("files", [])}
+        return sorted(f for f in listed if f.is_file())
 
+    excluded = set(data.get("tests", []))
     return sorted(
         f for f in pkg_dir.rglob("*")
         if f.is_file() and f.name not in excluded
     )
 
 
+# str(path) -> [size, mtime_ns, inode, sha256 hexdigest]
+_FILE_HASH_CACHE: dict[str, list] = {}
+
+
+def load_hash_cache(path: Path) -> None:
+    """Seed the file hash cache from a previous run, ignoring a missing or
+    unreadable file."""
+    try:
+        data = json.loads(path.read_text())
+    except (json.JSONDecodeError, OSError):
+        return
+    if isinstance(data, dict):
+        _FILE_HASH_CACHE.update(data)
+
+
+def save_hash_cache(path: Path) -> None:
+    """Persist the file hash cache, dropping entries for files that no longer
+    exist so the cache can't grow without bound."""
+    live = {k: v for k, v in _FILE_HASH_CACHE.items() if os.path.exists(k)}
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        tmp.write_text(json.dumps(live))
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"::warning::Could not write hash cache {path}: {e}")
+
+
+def hash_file(path: Path) -> str:
+    """Return the sha256 of a file, streamed in 1 MiB chunks.
+
+    Reuses the cached digest while (size, mtime_ns, inode) are unchanged, so a
+    warm run only stats each file."""
+    st = path.stat()
+    key = str(path)
+    stamp = [st.st_size, st.st_mtime_ns, st.st_ino]
+    cached = _FILE_HASH_CACHE.get(key)
+    if cached is not None and cached[:3] == stamp:
+        return cached[3]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    _FILE_HASH_CACHE[key] = stamp + [digest]
+    return digest
+
+
+def hash_files(paths: list[Path], max_workers: int = 8) -> dict[Path, str]:
+    """hash_file() over many paths on a thread pool (hashlib releases the GIL
+    on large buffers, so cold hashing scales with cores)."""
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return dict(zip(paths, pool.map(hash_file, paths)))
+
+
 _PYPI_VERSION_CACHE: dict[str, str | None] = {}
 
 
@@ -220,7 +411,8 @@ def get_latest_pypi_version(pip_name: str) -> str | None:
     )
     version: str | None
     try:
-        with urllib.request.urlopen(req, timeout=10) as resp:
+        with tracing.span("pypi_lookup", pkg=pip_name), \
+                urllib.request.urlopen(req, timeout=10) as resp:
             data = json.load(resp)
         version = data.get("info", {}).get("version") or None
     except (urllib.error.URLError, OSError, json.JSONDecodeError, ValueError):
@@ -229,17 +421,113 @@ def get_latest_pypi_version(pip_name: str) -> str | None:
     return version
 
 
+def _load_json_dict(path: Path | None) -> dict:
+    """Return the JSON object stored at path, or {} if absent/unreadable."""
+    if path is None:
+        return {}
+    try:
+        data = json.loads(path.read_text())
+    except (json.JSONDecodeError, OSError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def resolve_pypi_versions(
+    catalog: dict[str, Path],
+    packages_dir: Path,
+    *,
+    snapshot: dict[str, str | None] | None = None,
+    disk_cache_path: Path | None = None,
+    ttl: float = 6 * 3600,
+    offline: bool = False,
+    max_workers: int = 16,
+) -> dict[str, str | None]:
+    """Look up the PyPI version that will be built for every packages/ entry.
+
+    dependencies/ and build_tools/ entries are not on PyPI and are left out.
+    Sources are tried in order:
+
+      1. `snapshot`, a frozen {name: version} map (--pypi-snapshot). When
+         given it is authoritative: a name it maps to null (a lookup that
+         failed when it was taken) or doesn't list stays unresolved, and
+         nothing else is consulted, so every job of a run derives identical
+         cache keys;
+      2. the on-disk cache at `disk_cache_path`, for entries younger than
+         `ttl` seconds (any age when `offline`);
+      3. PyPI itself, all names concurrently, unless `offline`.
+
+    Successful PyPI lookups are written back to the disk cache. Anything
+    still unresolved maps to None, which cache keys fold in as "unknown".
+    """
+    names = sorted(n for n, d in catalog.items() if d.parent == packages_dir)
+    versions: dict[str, str | None] = {}
+    source: dict[str, str] = {}
+    if snapshot is not None:
+        for name in names:
+            versions[name] = snapshot.get(name) or None
+            if versions[name]:
+                print(f"PyPI {name}: {versions[name]} (snapshot)")
+            else:
+                print(f"PyPI {name}: unresolved in snapshot; using 'unknown'")
+        return versions
+
+    disk_cache = _load_json_dict(disk_cache_path)
+    now = time.time()
+    for name in names:
+        entry = disk_cache.get(name)
+        if name in versions or not isinstance(entry, dict) or not entry.get("version"):
+            continue
+        if offline or now - entry.get("fetched_at", 0) < ttl:
+            versions[name], source[name] = entry["version"], "disk cache"
+
+    missing = [n for n in names if n not in versions]
+    if missing and not offline:
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for name, version in zip(missing, pool.map(get_latest_pypi_version, missing)):
+                versions[name] = version
+                if version:
+                    source[name] = "pypi"
+                    disk_cache[name] = {"version": version, "fetched_at": now}
+        if disk_cache_path is not None:
+            try:
+                disk_cache_path.write_text(json.dumps(disk_cache, indent=2, sort_keys=True))
+            except OSError as e:
+                print(f"::warning::Could not write PyPI version cache {disk_cache_path}: {e}")
+
+    for name in names:
+        version = versions.get(name)
+        versions[name] = version
+        if version:
+            print(f"PyPI {name}: {version} ({source[name]})")
+        elif offline:
+            print(f"PyPI {name}: not in snapshot/cache and --offline; using 'unknown'")
+        else:
+            print(f"PyPI {name}: lookup failed; using 'unknown'")
+    return versions
+
+
 def compute_cache_keys(
     catalog: dict[str, Path],
     dep_graph: dict[str, set[str]],
     platform_suffix: str,
     packages_dir: Path,
+    versions: dict[str, str | None],
+    hash_cache_path: Path | None = None,
+    variant: str = "",
 ) -> dict[str, str]:
     """Compute a deterministic cache key per package.
 
-    Each key incorporates the SHA-256 of all build files in the package
-    directory (excluding tests) plus, recursively, the keys of all
-    transitive dependencies.
+    Keys read `<platform_suffix>-<variant>-<pip_name>-<hash>`. `variant`
+    names the runner and architecture (--cache-key-variant), since macOS
+    arm64 and x86_64 builds share a runner and a platform_suffix but not
+    their wheels; it defaults to platform.machine().
+
+    Each key incorporates the SHA-256 of the package's build files (see
+    get_build_files(); for versioned recipes only the selected scripts[]
+    entry's files, plus that entry itself) and, recursively, the keys of all
+    transitive dependencies. File digests come from hash_files(), backed by
+    the persistent stat-keyed cache at `hash_cache_path` when given.
 
     Entries that live directly under packages/ (real PyPI names) also fold in
     the current PyPI release version, so the cache invalidates when upstream
@@ -248,22 +536,30 @@ def compute_cache_keys(
     transient PyPI outage produces a consistent miss-then-cache rather than a
     cache that churns on every run.
     """
-    import hashlib
+    variant = variant or platform.machine().lower()
+    if hash_cache_path is not None:
+        load_hash_cache(hash_cache_path)
+    build_files = {pip_name: get_build_files(pkg_dir, versions.get(pip_name))
+                   for pip_name, pkg_dir in catalog.items()}
+    digests = hash_files([f for files in build_files.values() for f in files])
+    if hash_cache_path is not None:
+        save_hash_cache(hash_cache_path)
 
     own_hashes: dict[str, str] = {}
     for pip_name, pkg_dir in catalog.items():
         h = hashlib.sha256()
-        for f in get_build_files(pkg_dir):
+        for f in build_files[pip_name]:
             h.update(str(f.relative_to(pkg_dir)).encode())
-            h.update(f.read_bytes())
-        if pkg_dir.parent == packages_dir:
-            version = get_latest_pypi_version(pip_name)
+            h.update(digests[f].encode())
+        scripts = select_scripts(_read_index(pkg_dir), versions.get(pip_name))
+        if scripts:
+            # The entry's own fields (deps, build_requires, ...) shape the
+            # build too; the rest of index.json doesn't.
+            h.update(b"\x00scripts:")
+            h.update(json.dumps(scripts, sort_keys=True).encode())
+        if pip_name in versions:
             h.update(b"\x00pypi-version:")
-            h.update((version or "unknown").encode())
-            if version:
-                print(f"PyPI {pip_name}: {version}")
-            else:
-                print(f"PyPI {pip_name}: lookup failed; using 'unknown'")
+            h.update((versions[pip_name] or "unknown").encode())
         own_hashes[pip_name] = h.hexdigest()
 
     all_sorted = topo_sort(list(catalog.keys()), dep_graph)
@@ -277,32 +573,56 @@ def compute_cache_keys(
         full_hashes[pip_name] = h.hexdigest()
 
     return {
-        pip_name: f"{platform_suffix}-{pip_name}-{full_hashes[pip_name][:16]}"
+        pip_name: f"{platform_suffix}-{variant}-{pip_name}-{full_hashes[pip_name][:16]}"
         for pip_name in catalog
     }
 
 
+def _marker_sources(wheel_cache_dir: Path, marker_data) -> dict[str, Path]:
+    """Map wheel name -> file in the cache for a parsed marker.
+
+    Markers are {wheel_name: sha256} pointing into the content-addressed
+    objects/ store. Older caches wrote a plain list of names stored flat in
+    wheel_cache_dir; those are still honoured."""
+    if isinstance(marker_data, dict):
+        return {name: wheel_cache_dir / "objects" / f"{sha}.whl"
+                for name, sha in marker_data.items()}
+    return {name: wheel_cache_dir / name for name in marker_data}
+
+
+def _write_cache_meta(wheel_cache_dir: Path, cache_key: str, **updates) -> None:
+    """Merge `updates` into <cache_key>.meta and stamp the access time.
+    s3_cache.py gc uses {cost, atime} to decide what to evict."""
+    meta_path = wheel_cache_dir / f"{cache_key}.meta"
+    meta = _load_json_dict(meta_path)
+    meta.update(updates)
+    meta["atime"] = time.time()
+    meta_path.write_text(json.dumps(meta, sort_keys=True))
+
+
 def try_restore_from_cache(
     pkg_name: str,
     cache_key: str,
     wheel_cache_dir: Path,
     built_wheels_dir: Path,
 ) -> bool:
-    """If a cached build exists for this exact cache key, copy wheels out
-    and return True.  Otherwise return False."""
+    """If a cached build exists for this exact cache key, materialize its
+    wheels into built_wheels_dir and return True.  Otherwise return False."""
     marker = wheel_cache_dir / f"{cache_key}.marker"
     if not marker.exists():
         return False
     try:
-        whl_names = json.loads(marker.read_text())
+        sources = _marker_sources(wheel_cache_dir, json.loads(marker.read_text()))
     except (json.JSONDecodeError, OSError):
         return False
-    if not all((wheel_cache_dir / w).exists() for w in whl_names):
+    if not all(src.exists() for src in sources.values()):
         return False
-    for w in whl_names:
-        dest = built_wheels_dir / w
-        if not dest.exists():
-            shutil.copy2(wheel_cache_dir / w, dest)
+    with _WHEEL_DIR_LOCK:
+        for name, src in sources.items():
+            dest = built_wheels_dir / name
+            if not dest.exists():
+                link_or_clone(src, dest)
+    _write_cache_meta(wheel_cache_dir, cache_key)
     return True
 
 
@@ -311,16 +631,68 @@ def save_to_cache(
     new_wheels: set[str],
     wheel_cache_dir: Path,
     built_wheels_dir: Path,
+    *,
+    pkg_name: str = "",
+    cost: float = 0.0,
 ):
     """Persist newly-built wheels and write a marker so future runs can
-    restore them."""
-    wheel_cache_dir.mkdir(parents=True, exist_ok=True)
-    whl_list = sorted(new_wheels)
-    for w in whl_list:
+    restore them.
+
+    Wheels are stored once under objects/<sha256>.whl, so a wheel shared by
+    several cache keys (or rebuilt byte-identically) costs no extra space.
+    `cost` is the build time in seconds, recorded so gc evicts cheap
+    rebuilds before expensive ones."""
+    objects_dir = wheel_cache_dir / "objects"
+    objects_dir.mkdir(parents=True, exist_ok=True)
+    entries: dict[str, str] = {}
+    for w in sorted(new_wheels):
         src = built_wheels_dir / w
-        if src.exists():
-            shutil.copy2(src, wheel_cache_dir / w)
-    (wheel_cache_dir / f"{cache_key}.marker").write_text(json.dumps(whl_list))
+        if not src.exists():
+            continue
+        sha = hash_file(src)
+        stored = objects_dir / f"{sha}.whl"
+        if not stored.exists():
+            try:
+                link_or_clone(src, stored)
+            except FileExistsError:
+                pass  # a parallel build stored the same bytes first
+        entries[w] = sha
+    _write_cache_meta(wheel_cache_dir, cache_key, pkg=pkg_name, cost=round(cost, 1),
+                      saved=time.time())
+    (wheel_cache_dir / f"{cache_key}.marker").write_text(json.dumps(entries, sort_keys=True))
+
+
+# (s3 client, bucket) once --s3-cache is given; see s3_cache.py for the layout.
+_S3_CACHE: tuple | None = None
+
+
+def fetch_remote_entry(cache_key: str, wheel_cache_dir: Path, out=None) -> bool:
+    """Pull one per-entry cache object set from S3 into wheel_cache_dir.
+    Any S3 failure is reported and treated as a miss."""
+    if _S3_CACHE is None:
+        return False
+    import s3_cache
+    s3, bucket = _S3_CACHE
+    try:
+        return s3_cache.fetch_entry(s3, bucket, cache_key, wheel_cache_dir)
+    except Exception as e:
+        print(f"::warning::S3 cache fetch failed for {cache_key}: {e}", file=out)
+        return False
+
+
+def push_remote_entry(cache_key: str, wheel_cache_dir: Path, out=None) -> None:
+    """Upload one freshly saved cache entry to S3. Failures only warn: the
+    build itself succeeded and the next run will simply rebuild."""
+    if _S3_CACHE is None:
+        return
+    import s3_cache
+    s3, bucket = _S3_CACHE
+    try:
+        uploaded = s3_cache.push_entry(s3, bucket, cache_key, wheel_cache_dir)
+    except Exception as e:
+        print(f"::warning::S3 cache upload failed for {cache_key}: {e}", file=out)
+        return
+    print(f"Pushed cache entry {cache_key} to S3 ({uploaded:,} new wheel bytes)", file=out)
 
 
 def iter_pure_test_packages(root_dir: Path, packages_dir: Path) -> list[tuple[str, str, Path]]:
@@ -425,6 +797,51 @@ def find_prebuild_candidates(dep_graph: dict[str, set[str]], threshold: int = 2)
     return sorted(candidates)
 
 
+def load_timings(paths: list[Path]) -> dict[str, float]:
+    """Merge recorded {item: seconds} maps from JSON files, or from every
+    *.json below a directory. Later files win. Missing paths and unreadable
+    files are skipped, so an absent history simply yields {}."""
+    timings: dict[str, float] = {}
+    for path in paths:
+        files = sorted(path.rglob("*.json")) if path.is_dir() else [path]
+        for f in files:
+            try:
+                data = json.loads(f.read_text())
+            except (json.JSONDecodeError, OSError):
+                continue
+            if isinstance(data, dict):
+                timings.update({k: float(v) for k, v in data.items()
+                                if isinstance(v, (int, float))})
+    return timings
+
+
+def partition_splits(items: list[str], split_total: int,
+                     history: dict[str, float]) -> list[list[str]]:
+    """Distribute items over split_total splits.
+
+    With recorded durations this is longest-processing-time-first bin
+    packing: items are taken most expensive first and each goes to the
+    currently lightest split. Items without history are costed at the median
+    of the known ones. Without any history it falls back to the plain
+    `i % split_total` round robin over `items` in their given order.
+
+    Every split job calls this independently, so the result must depend on
+    nothing but the arguments: ties are broken by name and split index."""
+    known = sorted(history[i] for i in items if i in history)
+    if not known:
+        return [[item for i, item in enumerate(items) if i % split_total == idx]
+                for idx in range(split_total)]
+    default = known[len(known) // 2]
+    cost = {item: history.get(item, default) for item in items}
+    splits: list[list[str]] = [[] for _ in range(split_total)]
+    loads = [0.0] * split_total
+    for item in sorted(items, key=lambda i: (-cost[i], i)):
+        idx = min(range(split_total), key=lambda b: (loads[b], b))
+        splits[idx].append(item)
+        loads[idx] += cost[item]
+    return splits
+
+
 def topo_sort(packages: list[str], dep_graph: dict[str, set[str]]) -> list[str]:
     """Return packages in topological order (deps before dependents). Kahn's algorithm."""
     pkg_set = set(packages)
@@ -452,14 +869,89 @@ def topo_sort(packages: list[str], dep_graph: dict[str, set[str]]) -> list[str]:
     return result
 
 
+def run_dag(
+    packages: list[str],
+    dep_graph: dict[str, set[str]],
+    jobs: int,
+    build_fn,
+) -> list[str]:
+    """Run build_fn(pkg, slot) for every package with up to `jobs` in flight.
+
+    A package starts as soon as all of its dependencies inside `packages` have
+    succeeded, instead of waiting for a tier barrier. `slot` is an index in
+    range(jobs) that is held by exactly one running package, so callers can
+    use it to pick an isolated work interpreter and pip cache. build_fn
+    returns (ok, log); each log is printed as one ::group:: when the package
+    finishes so concurrent output never interleaves.
+
+    After the first failure no new packages are started, but those already
+    running are allowed to finish. Returns the failed and never-started
+    packages (empty on success)."""
+    import concurrent.futures
+
+    pkg_set = set(packages)
+    order = {p: i for i, p in enumerate(topo_sort(packages, dep_graph))}
+    waiting_on = {p: {d for d in dep_graph.get(p, set()) if d in pkg_set}
+                  for p in packages}
+    free_slots = list(range(jobs))
+    running: dict[concurrent.futures.Future, tuple[str, int]] = {}
+    failed: list[str] = []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        while True:
+            if not failed:
+                ready = sorted((p for p, deps in waiting_on.items() if not deps),
+                               key=order.__getitem__)
+                for pkg in ready[:len(free_slots)]:
+                    slot = free_slots.pop(0)
+                    del waiting_on[pkg]
+                    running[pool.submit(build_fn, pkg, slot)] = (pkg, slot)
+            if not running:
+                break
+            finished, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for fut in finished:
+                pkg, slot = running.pop(fut)
+                free_slots.append(slot)
+                free_slots.sort()
+                try:
+                    ok, log = fut.result()
+                except Exception as e:
+                    ok, log = False, f"{type(e).__name__}: {e}\n"
+                print(f"::group::Building {pkg}")
+                print(log, end="")
+                print("::endgroup::")
+                if ok:
+                    for deps in waiting_on.values():
+                        deps.discard(pkg)
+                else:
+                    failed.append(pkg)
+
+    if waiting_on and not failed:
+        # Nothing failed but some packages never became ready: a cycle.
+        print(f"::error::Dependency cycle among: {sorted(waiting_on)}")
+    return failed + sorted(waiting_on)
+
+
 def run_build(
     monolithpy: Path,
     package_name: str,
     pip_cache_dir: Path | None = None,
     find_links_dir: Path | None = None,
+    report_path: Path | None = None,
+    out=None,
 ) -> bool:
-    """Attempt to build a package. Returns True on success."""
+    """Attempt to build a package. Returns True on success.
+
+    `report_path` makes pip write its --report JSON there, from which
+    wheels_built_from_source() learns exactly which wheels this install
+    built. `out`, if given, is a file object that receives pip's stdout and
+    stderr instead of the console."""
     cmd = [str(monolithpy), "-m", "pip", "install", "--verbose"]
+    if report_path is not None:
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        report_path.unlink(missing_ok=True)
+        cmd += ["--report", str(report_path)]
     if pip_cache_dir is not None:
         pip_cache_dir.mkdir(parents=True, exist_ok=True)
         cmd += ["--cache-dir", str(pip_cache_dir)]
@@ -472,30 +964,117 @@ def run_build(
         env["PIP_FIND_LINKS"] = str(find_links_dir)
 
     try:
-        result = subprocess.run(cmd, env=env)
+        result = subprocess.run(cmd, env=env, stdout=out,
+                                stderr=subprocess.STDOUT if out else None)
         return result.returncode == 0
     except Exception as e:
-        print(f"Build error: {e}", file=sys.stderr)
+        print(f"Build error: {e}", file=out or sys.stderr)
         return False
 
 
-def run_test(monolithpy: Path, test_path: Path) -> bool:
+def run_test(monolithpy: Path, test_path: Path, out=None) -> bool:
     """Run a test file. Returns True on success."""
+    err = out or sys.stderr
     try:
-        result = subprocess.run([str(monolithpy), str(test_path)])
+        result = subprocess.run([str(monolithpy), str(test_path)], stdout=out,
+                                stderr=subprocess.STDOUT if out else None)
     except Exception as e:
-        print(f"Test error: {e}", file=sys.stderr)
+        print(f"Test error: {e}", file=err)
         return False
     rc = result.returncode
     if rc == 0:
         return True
     if rc < 0:
-        print(f"Test killed by signal {-rc}", file=sys.stderr)
+        print(f"Test killed by signal {-rc}", file=err)
     else:
-        print(f"Test exited with code {rc}", file=sys.stderr)
+        print(f"Test exited with code {rc}", file=err)
     return False
 
 
+def build_package(
+    pkg_name: str,
+    pkg_dir: Path,
+    monolithpy: Path,
+    *,
+    cache_key: str | None,
+    wheel_cache_dir: Path | None,
+    built_wheels_dir: Path,
+    pip_cache_dir: Path,
+    find_links_dir: Path | None,
+    timings: dict[str, float] | None = None,
+    prepare_interpreter=None,
+    out=None,
+) -> bool:
+    """Restore one package from the wheel cache or build it, then run its tests.
+
+    Returns False on a build or test failure; the caller decides whether that
+    aborts the run. All progress goes to `out` (default: stdout) so parallel
+    builds can each write to their own log. On a successful cache miss the
+    build+test wall time is stored in `timings[pkg_name]`; cache hits are not
+    recorded since they say nothing about the cost of a rebuild.
+
+    `prepare_interpreter`, if given, is called on a cache miss before
+    `monolithpy` is first used, so callers can defer creating it until a
+    build actually needs it."""
+    if cache_key and wheel_cache_dir:
+        with tracing.span("cache_restore", pkg=pkg_name):
+            hit = try_restore_from_cache(pkg_name, cache_key, wheel_cache_dir, built_wheels_dir)
+            if not hit and fetch_remote_entry(cache_key, wheel_cache_dir, out=out):
+                hit = try_restore_from_cache(pkg_name, cache_key, wheel_cache_dir,
+                                             built_wheels_dir)
+        if hit:
+            print(f"Cache HIT for {pkg_name} (key: {cache_key})", file=out)
+            return True
+        print(f"Cache MISS for {pkg_name} (key: {cache_key})", file=out)
+
+    start = time.monotonic()
+    if prepare_interpreter:
+        prepare_interpreter()
+    with tracing.span("run_rebuild", pkg=pkg_name):
+        run_rebuild(monolithpy, out=out)
+
+    print(f"Building {pkg_name}...", file=out)
+    report_path = pip_cache_dir / "reports" / f"{pkg_name}.json"
+    with tracing.span("run_build", pkg=pkg_name):
+        success = run_build(
+            monolithpy, pkg_name,
+            pip_cache_dir=pip_cache_dir,
+            find_links_dir=find_links_dir,
+            report_path=report_path,
+            out=out,
+        )
+    if not success:
+        print(f"::error::Build failed for {pkg_name}", file=out)
+        return False
+
+    print(f"Build successful for {pkg_name}", file=out)
+    with tracing.span("collect_built_wheels", pkg=pkg_name):
+        new_wheels = collect_built_wheels(pip_cache_dir, built_wheels_dir, out=out,
+                                          only=wheels_built_from_source(report_path))
+
+    if cache_key and wheel_cache_dir and new_wheels:
+        with tracing.span("cache_save", pkg=pkg_name):
+            save_to_cache(cache_key, new_wheels, wheel_cache_dir, built_wheels_dir,
+                          pkg_name=pkg_name, cost=time.monotonic() - start)
+        print(f"Cached {len(new_wheels)} wheel(s) for {pkg_name}", file=out)
+        with tracing.span("cache_push", pkg=pkg_name):
+            push_remote_entry(cache_key, wheel_cache_dir, out=out)
+
+    for test_file in get_tests_from_index(pkg_dir / "index.json"):
+        test_path = pkg_dir / test_file
+        if test_path.exists():
+            print(f"Running test: {test_file}", file=out)
+            with tracing.span("run_test", pkg=pkg_name, test=test_file):
+                passed = run_test(monolithpy, test_path, out=out)
+            if not passed:
+                print(f"::error::Test failed for {pkg_name}/{test_file}", file=out)
+                return False
+            print(f"Test passed for {pkg_name}/{test_file}", file=out)
+    if timings is not None:
+        timings[pkg_name] = round(time.monotonic() - start, 1)
+    return True
+
+
 def main():
     import argparse
     parser = argparse.ArgumentParser()
@@ -511,13 +1090,60 @@ def main():
                         default=os.environ.get("MONOLITHPY_TAG"),
                         help="MonolithPy Python version tag (e.g. 'mp313', 'mp314'). "
                              "Defaults to $MONOLITHPY_TAG.")
+    parser.add_argument("--timings", nargs="+", type=Path, default=[], metavar="PATH",
+                        help="Recorded per-package durations (JSON files or directories "
+                             "of them) from earlier runs, used to balance --round2 splits.")
+    parser.add_argument("--record-timings", type=Path, metavar="FILE",
+                        help="Write the build+test duration of every package this job "
+                             "handled to FILE, for use as --timings in later runs.")
+    parser.add_argument("--jobs", type=int, default=1, metavar="N",
+                        help="With --prebuild, build up to N independent packages "
+                             "concurrently, each in its own work interpreter.")
+    parser.add_argument("--hash-cache", type=Path, metavar="FILE",
+                        default=Path(tempfile.gettempdir()) / "mpy-build-hash-cache.json",
+                        help="Persistent (path, size, mtime, inode) -> sha256 cache used "
+                             "when computing cache keys.")
+    parser.add_argument("--cache-key-variant", default="",
+                        help="Runner/architecture component of the wheel cache keys, "
+                             "e.g. 'macos-26-arm64' (default: platform.machine()).")
+    parser.add_argument("--pypi-snapshot", type=Path, metavar="FILE",
+                        help="Frozen {name: version} map to use instead of live PyPI "
+                             "lookups, so every job of a run computes the same cache keys. "
+                             "Authoritative: names it maps to null are not looked up again.")
+    parser.add_argument("--save-pypi-snapshot", type=Path, metavar="FILE",
+                        help="Write the resolved PyPI versions to FILE for --pypi-snapshot.")
+    parser.add_argument("--offline", action="store_true",
+                        help="Never query PyPI; use the snapshot and on-disk cache only.")
+    parser.add_argument("--pypi-cache", type=Path, metavar="FILE",
+                        default=Path(tempfile.gettempdir()) / "mpy-pypi-versions.json",
+                        help="On-disk PyPI version cache shared between local runs.")
+    parser.add_argument("--pypi-cache-ttl", type=float, default=6 * 3600, metavar="SECONDS",
+                        help="Maximum age of an on-disk PyPI cache entry (default: 6h).")
+    parser.add_argument("--trace", type=Path, metavar="FILE",
+                        help="Write a Chrome trace-event JSON timeline of every phase to FILE.")
+    parser.add_argument("--s3-cache", action="store_true",
+                        help="Back --wheel-cache-dir with per-entry S3 objects: fetch "
+                             "missing cache keys on demand and push new ones after each "
+                             "build. Uses the S3_CACHE_* environment variables.")
     args = parser.parse_args()
+    if args.trace:
+        tracing.enable(args.trace, process_name="build_and_test")
+    if args.s3_cache:
+        if not args.wheel_cache_dir:
+            print("Error: --s3-cache requires --wheel-cache-dir.", file=sys.stderr)
+            sys.exit(1)
+        import s3_cache
+        global _S3_CACHE
+        _S3_CACHE = (s3_cache.s3_client(), os.environ["S3_CACHE_BUCKET"])
 
     if not args.monolithpy_tag:
         print("Error: --monolithpy-tag or MONOLITHPY_TAG env var is required "
               "(e.g. 'mp313', 'mp314').", file=sys.stderr)
         sys.exit(1)
     python_version = parse_python_version(args.monolithpy_tag)
+    if args.jobs < 1:
+        print("Error: --jobs must be at least 1.", file=sys.stderr)
+        sys.exit(1)
 
     root_dir = Path.cwd()
     monolithpy_dir = root_dir / "monolithpy"
@@ -545,21 +1171,55 @@ def main():
         sys.exit(1)
 
     pristine_dir = root_dir / "monolithpy_pristine"
-    shutil.copytree(monolithpy_dir, pristine_dir, dirs_exist_ok=True)
+    with tracing.span("clone_tree", dst=pristine_dir.name):
+        if pristine_dir.exists():
+            rmtree_force(pristine_dir)
+        method = clone_tree(monolithpy_dir, pristine_dir)
+    print(f"Work interpreters are snapshotted via {method}")
 
     work_monolithpy = root_dir / "monolithpy_work"
 
     # Full catalog across packages/, dependencies/, build_tools/
     catalog = build_catalog(packages_dir, dependencies_dir, build_tools_dir)
-    dep_graph = build_dep_graph(catalog)
+    # The PyPI version picks which scripts[] entry applies, which in turn
+    # decides both the graph edges and the hashed files.
+    snapshot = None
+    if args.pypi_snapshot:
+        if not args.pypi_snapshot.is_file():
+            print(f"::error::PyPI snapshot {args.pypi_snapshot} not found", file=sys.stderr)
+            sys.exit(1)
+        snapshot = _load_json_dict(args.pypi_snapshot)
+    with tracing.span("resolve_pypi_versions"):
+        versions = resolve_pypi_versions(
+            catalog, packages_dir,
+            snapshot=snapshot,
+            disk_cache_path=args.pypi_cache,
+            ttl=args.pypi_cache_ttl,
+            offline=args.offline,
+        )
+    if args.save_pypi_snapshot:
+        args.save_pypi_snapshot.parent.mkdir(parents=True, exist_ok=True)
+        # Failed lookups are kept as null so later jobs don't retry them
+        # and end up with different cache keys.
+        args.save_pypi_snapshot.write_text(json.dumps(versions, indent=2, sort_keys=True))
+        print(f"Saved PyPI version snapshot to {args.save_pypi_snapshot}")
+    dep_graph = build_dep_graph(catalog, versions)
 
     wheel_cache_dir = Path(args.wheel_cache_dir) if args.wheel_cache_dir else None
-    cache_keys = compute_cache_keys(catalog, dep_graph, platform_suffix, packages_dir) if wheel_cache_dir else {}
+    cache_keys: dict[str, str] = {}
+    if wheel_cache_dir:
+        with tracing.span("compute_cache_keys"):
+            cache_keys = compute_cache_keys(catalog, dep_graph, platform_suffix, packages_dir,
+                                            versions, hash_cache_path=args.hash_cache,
+                                            variant=args.cache_key_variant)
     if cache_keys:
         print(f"Computed cache keys for {len(cache_keys)} packages")
 
     round1_wheels_dir = Path(args.round1_wheels) if args.round1_wheels else None
+    timings_history = load_timings(args.timings)
+    timings: dict[str, float] = {}
 
+    my_pure_tests: list[tuple[str, str, Path]] = []
     if args.prebuild:
         candidates = find_prebuild_candidates(dep_graph, threshold=2)
         all_prebuild = topo_sort(candidates, dep_graph)
@@ -586,18 +1246,22 @@ def main():
     else:
         all_packages = sorted(d.name for d in _iter_subdirs(packages_dir))
         pure_test_entries = iter_pure_test_packages(root_dir, packages_dir)
-        my_pure_tests: list[tuple[str, str, Path]] = []
         if args.round2:
             split_index, split_total = int(args.round2[0]), int(args.round2[1])
             # Combined index space across builds and pure-tests so the split
             # math distributes both evenly; otherwise a large pure-test set
-            # would all land on split 0.
-            combined = ([("build", name) for name in all_packages] +
-                        [("pure",  name) for name, _, _ in pure_test_entries])
-            my = [item for i, item in enumerate(combined) if i % split_total == split_index]
-            all_packages = [name for kind, name in my if kind == "build"]
-            pure_in_split = {name for kind, name in my if kind == "pure"}
+            # would all land on split 0. Pure-tests are keyed "pure:<name>".
+            combined = (all_packages +
+                        [f"pure:{name}" for name, _, _ in pure_test_entries])
+            splits = partition_splits(combined, split_total, timings_history)
+            my = splits[split_index]
+            all_packages = [item for item in combined if item in my and not item.startswith("pure:")]
+            pure_in_split = {item.removeprefix("pure:") for item in my if item.startswith("pure:")}
             my_pure_tests = [(n, p, t) for (n, p, t) in pure_test_entries if n in pure_in_split]
+            if any(item in timings_history for item in combined):
+                est = sum(timings_history.get(item, 0.0) for item in my)
+                print(f"Round 2 partitioned by recorded durations (LPT); "
+                      f"this split has ~{est / 60:.0f} min of known work")
             print(f"Round 2, split {split_index+1}/{split_total}: {len(all_packages)} build "
                   f"package(s) + {len(my_pure_tests)} pure-test(s)")
             if all_packages:
@@ -610,72 +1274,85 @@ def main():
             print(f"Using Round 1 pre-built wheels from: {round1_wheels_dir}")
         tiers = [("all", all_packages)]
 
-    for tier_label, tier_packages in tiers:
-        if args.prebuild:
-            print(f"::group::=== Tier: {tier_label} ({len(tier_packages)} packages) ===")
-
-        # Reset once per tier, carry forward within so tools/deps accumulate.
-        if work_monolithpy.exists():
-            rmtree_force(work_monolithpy)
-        shutil.copytree(pristine_dir, work_monolithpy)
-
-        for pkg_name in tier_packages:
-            pkg_dir = catalog[pkg_name]
-            print(f"::group::Building {pkg_name}")
-
-            cache_key = cache_keys.get(pkg_name)
-            if cache_key and wheel_cache_dir:
-                if try_restore_from_cache(pkg_name, cache_key, wheel_cache_dir, built_wheels_dir):
-                    print(f"Cache HIT for {pkg_name} (key: {cache_key})")
-                    print("::endgroup::")
-                    continue
-                print(f"Cache MISS for {pkg_name} (key: {cache_key})")
-
+    find_links_dir = built_wheels_dir if args.prebuild else round1_wheels_dir
+
+    if args.prebuild and args.jobs > 1:
+        # One DAG across every selected tier: a package starts as soon as its
+        # last dependency finishes. Each running package gets its own slot
+        # (work interpreter + pip cache) so concurrent installs can't collide.
+        dag_packages = [p for _, pkgs in tiers for p in pkgs]
+        build_logs_dir = root_dir / "build-logs"
+        build_logs_dir.mkdir(exist_ok=True)
+        print(f"Parallel pre-build: {len(dag_packages)} packages on {args.jobs} jobs")
+
+        def build_node(pkg_name: str, slot: int) -> tuple[bool, str]:
+            slot_monolithpy = root_dir / f"monolithpy_work_{slot}"
+
+            # Only a cache miss needs a fresh interpreter; on Windows the
+            # clone is a full copytree, so hits must not pay for it.
+            def fresh_interpreter() -> None:
+                with tracing.span("clone_tree", dst=slot_monolithpy.name):
+                    if slot_monolithpy.exists():
+                        rmtree_force(slot_monolithpy)
+                    clone_tree(pristine_dir, slot_monolithpy)
+
+            log_path = build_logs_dir / f"{pkg_name}.log"
+            # Append mode so pip's writes via the inherited fd and our own
+            # prints both land at the end of the file.
+            with open(log_path, "a", buffering=1, encoding="utf-8", errors="replace") as log, \
+                    tracing.span(pkg_name, cat="package"):
+                ok = build_package(
+                    pkg_name, catalog[pkg_name],
+                    get_monolithpy_executable(slot_monolithpy, python_version),
+                    cache_key=cache_keys.get(pkg_name),
+                    wheel_cache_dir=wheel_cache_dir,
+                    built_wheels_dir=built_wheels_dir,
+                    pip_cache_dir=root_dir / f".pip-wheel-cache-{slot}",
+                    find_links_dir=find_links_dir,
+                    timings=timings,
+                    prepare_interpreter=fresh_interpreter,
+                    out=log,
+                )
+            return ok, log_path.read_text(encoding="utf-8", errors="replace")
+
+        failed = run_dag(dag_packages, dep_graph, args.jobs, build_node)
+        if failed:
+            print(f"::error::Pre-build failed: {failed}")
+            sys.exit(1)
+        print("Parallel pre-build complete.")
+    else:
+        for tier_label, tier_packages in tiers:
+            if args.prebuild:
+                print(f"::group::=== Tier: {tier_label} ({len(tier_packages)} packages) ===")
+
+            # Reset once per tier, carry forward within so tools/deps accumulate.
+            with tracing.span("clone_tree", dst=work_monolithpy.name):
+                if work_monolithpy.exists():
+                    rmtree_force(work_monolithpy)
+                clone_tree(pristine_dir, work_monolithpy)
             monolithpy = get_monolithpy_executable(work_monolithpy, python_version)
-            run_rebuild(monolithpy)
-
-            pip_cache_dir = pip_cache_base
-            find_links_dir = built_wheels_dir if args.prebuild else round1_wheels_dir
-
-            pre_build_wheels = {w.name for w in built_wheels_dir.glob("*.whl")}
 
-            print(f"Building {pkg_name}...")
-            success = run_build(
-                monolithpy, pkg_name,
-                pip_cache_dir=pip_cache_dir,
-                find_links_dir=find_links_dir,
-            )
-            if not success:
-                print(f"::error::Build failed for {pkg_name}")
+            for pkg_name in tier_packages:
+                print(f"::group::Building {pkg_name}")
+                with tracing.span(pkg_name, cat="package"):
+                    ok = build_package(
+                        pkg_name, catalog[pkg_name], monolithpy,
+                        cache_key=cache_keys.get(pkg_name),
+                        wheel_cache_dir=wheel_cache_dir,
+                        built_wheels_dir=built_wheels_dir,
+                        pip_cache_dir=pip_cache_base,
+                        find_links_dir=find_links_dir,
+                        timings=timings,
+                    )
                 print("::endgroup::")
-                sys.exit(1)
-
-            print(f"Build successful for {pkg_name}")
-            collect_built_wheels(pip_cache_dir, built_wheels_dir)
-
-            if cache_key and wheel_cache_dir:
-                new_wheels = {w.name for w in built_wheels_dir.glob("*.whl")} - pre_build_wheels
-                if new_wheels:
-                    save_to_cache(cache_key, new_wheels, wheel_cache_dir, built_wheels_dir)
-                    print(f"Cached {len(new_wheels)} wheel(s) for {pkg_name}")
-
-            tests = get_tests_from_index(pkg_dir / "index.json")
-            for test_file in tests:
-                test_path = pkg_dir / test_file
-                if test_path.exists():
-                    print(f"Running test: {test_file}")
-                    if not run_test(monolithpy, test_path):
-                        print(f"::error::Test failed for {pkg_name}/{test_file}")
-                        print("::endgroup::")
-                        sys.exit(1)
-                    print(f"Test passed for {pkg_name}/{test_file}")
-
-            print("::endgroup::")
+                if not ok:
+                    sys.exit(1)
 
-        if args.prebuild:
-            collect_built_wheels(pip_cache_base, built_wheels_dir)
-            print(f"Tier {tier_label} complete.")
-            print("::endgroup::")
+            if args.prebuild:
+                with tracing.span("collect_built_wheels"):
+                    collect_built_wheels(pip_cache_base, built_wheels_dir)
+                print(f"Tier {tier_label} complete.")
+                print("::endgroup::")
 
     # Pure-test pass: capture a wheel for each entry into built_wheels/ (so it
     # rides along with the other Round 2 outputs through wheels-<platform>-<split>
@@ -684,24 +1361,47 @@ def main():
     # PyPI, not a local recipe, so per-recipe cache keys don't apply.
     if not args.prebuild and my_pure_tests:
         monolithpy = get_monolithpy_executable(work_monolithpy, python_version)
-        run_rebuild(monolithpy)
+        with tracing.span("run_rebuild"):
+            run_rebuild(monolithpy)
         for name, pin, test_path in my_pure_tests:
             requirement = name + pin  # pin already includes the operator (e.g. ">=2.30")
             print(f"::group::Pure test: {name} ({requirement!r})")
-            if not run_pure_test_install(monolithpy, requirement,
-                                         built_wheels_dir=built_wheels_dir,
-                                         find_links_dir=round1_wheels_dir,
-                                         pip_cache_dir=pip_cache_base):
+            start = time.monotonic()
+            with tracing.span("pure_test_install", pkg=name):
+                installed = run_pure_test_install(monolithpy, requirement,
+                                                  built_wheels_dir=built_wheels_dir,
+                                                  find_links_dir=round1_wheels_dir,
+                                                  pip_cache_dir=pip_cache_base)
+            if not installed:
                 print(f"::error::pip wheel/install failed for pure test {name}")
                 print("::endgroup::")
                 sys.exit(1)
             print(f"Running test: pure_test_packages/{name}/test.py")
-            if not run_test(monolithpy, test_path):
+            with tracing.span("run_test", pkg=name, test="test.py"):
+                passed = run_test(monolithpy, test_path)
+            if not passed:
                 print(f"::error::Pure test failed for {name}")
                 print("::endgroup::")
                 sys.exit(1)
             print(f"Pure test passed: {name}")
             print("::endgroup::")
+            timings[f"pure:{name}"] = round(time.monotonic() - start, 1)
+
+    if _RELINK_SECONDS:
+        print(f"rebuildpython ran {len(_RELINK_SECONDS)} time(s), "
+              f"{sum(_RELINK_SECONDS):.0f}s total")
+
+    if args.record_timings:
+        # Cache hits carry their historical duration forward so one warm run
+        # doesn't erase what we know about an expensive package.
+        handled = ([p for _, pkgs in tiers for p in pkgs] +
+                   [f"pure:{n}" for n, _, _ in my_pure_tests])
+        recorded = {item: timings.get(item, timings_history.get(item))
+                    for item in handled
+                    if item in timings or item in timings_history}
+        args.record_timings.parent.mkdir(parents=True, exist_ok=True)
+        args.record_timings.write_text(json.dumps(recorded, indent=2, sort_keys=True))
+        print(f"Recorded {len(recorded)} duration(s) to {args.record_timings}")
 
 
 if __name__ == "__main__":
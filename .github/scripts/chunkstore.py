@@ -0,0 +1,268 @@
+"""Content-defined chunk store for archive streams in the S3 cache bucket.
+
+Successive cache and snapshot archives mostly hold the same wheels. Storing
+them as chunks lets each new archive upload only the chunks the bucket has
+never seen, and each restore download only the chunks missing from a local
+chunk cache:
+
+    chunks/<sha256>                 # one chunk; raw or zstd (see Metadata)
+    <archive>.chunks.json           # recipe: ordered [[sha256, size], ...]
+
+Chunk boundaries are content-defined: a chunk ends right after the first
+ANCHOR at or past MIN_SIZE bytes, or at MAX_SIZE. Finding the anchor with
+bytes.find keeps chunking at memory speed in pure Python (a per-byte rolling
+hash would not), and boundaries still resynchronise right after an insertion
+or deletion. Over compressed payloads such as wheels the two-byte anchor
+turns up every 64 KiB on average, so chunks average about MIN_SIZE + 64 KiB.
+
+Chunk the uncompressed tar stream, not a compressed one: a compressor's
+output changes everywhere after the first differing byte.
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+ANCHOR = b"\x9e\x37"
+MIN_SIZE = 2 * 1024 * 1024
+MAX_SIZE = 8 * 1024 * 1024
+CHUNK_PREFIX = "chunks/"
+RECIPE_SUFFIX = ".chunks.json"
+
+
+def iter_chunks(stream):
+    """Yield the content-defined chunks of a readable binary stream."""
+    buf = bytearray()
+    eof = False
+    while True:
+        while len(buf) < MAX_SIZE and not eof:
+            data = stream.read(MAX_SIZE - len(buf))
+            if not data:
+                eof = True
+            buf += data
+        if not buf:
+            return
+        end = buf.find(ANCHOR, MIN_SIZE - len(ANCHOR), MAX_SIZE)
+        end = min(len(buf), MAX_SIZE) if end == -1 else end + len(ANCHOR)
+        yield bytes(buf[:end])
+        del buf[:end]
+
+
+class _ProducerPipe(io.BufferedReader):
+    """Read end of producer_pipe. At EOF it waits for the producer and raises
+    whatever the producer raised, so the consumer fails before it can act on
+    a stream that was cut short (complete a multipart upload, write a chunk
+    recipe) rather than after."""
+
+    def __init__(self, fd: int, producer: threading.Thread, failure: list):
+        super().__init__(io.FileIO(fd, "rb"), buffer_size=1 << 20)
+        self._producer = producer
+        self._failure = failure
+
+    def _check_eof(self) -> None:
+        self._producer.join()
+        if self._failure:
+            raise self._failure[0]
+
+    def read(self, size=-1):
+        data = super().read(size)
+        if not data and size != 0:
+            self._check_eof()
+        return data
+
+    def read1(self, size=-1):
+        data = super().read1(size)
+        if not data and size != 0:
+            self._check_eof()
+        return data
+
+    def readinto(self, b):
+        n = super().readinto(b)
+        if not n and len(b):
+            self._check_eof()
+        return n
+
+
+@contextmanager
+def producer_pipe(write_fn):
+    """Run write_fn(file) on a thread and yield the read end of its pipe.
+
+    Reading EOF from the pipe joins the producer and re-raises any exception
+    it raised, as does leaving the block, so a consumer never takes a stream
+    that was cut short for a complete one."""
+    failure: list[BaseException] = []
+    read_fd, write_fd = os.pipe()
+
+    def produce():
+        try:
+            with os.fdopen(write_fd, "wb") as pipe:
+                write_fn(pipe)
+        except BaseException as e:
+            failure.append(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    with _ProducerPipe(read_fd, producer, failure) as pipe:
+        yield pipe
+    producer.join()
+    if failure:
+        raise failure[0]
+
+
+def _exists(s3, bucket: str, key: str) -> bool:
+    from botocore.exceptions import ClientError
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code", "") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+
+def _encode(chunk: bytes) -> tuple[str, bytes]:
+    """zstd-compress a chunk, keeping it raw unless that saves 5%."""
+    import zstandard
+    packed = zstandard.ZstdCompressor(level=3).compress(chunk)
+    if len(packed) < 0.95 * len(chunk):
+        return "zstd", packed
+    return "raw", chunk
+
+
+def upload_chunked(s3, bucket: str, stream, recipe_key: str, *, workers: int = 8) -> dict:
+    """Chunk `stream`, upload the chunks the bucket lacks and then the recipe.
+    The recipe is only written once `stream` has reached EOF without error
+    (a producer_pipe raises its producer's failure at EOF).
+
+    At most 2 * workers chunks are in flight, which bounds memory to about
+    2 * workers * MAX_SIZE. Returns {chunks, new_chunks, size, uploaded}."""
+    import concurrent.futures
+
+    def put(sha: str, chunk: bytes) -> int:
+        key = f"{CHUNK_PREFIX}{sha}"
+        if _exists(s3, bucket, key):
+            return 0
+        encoding, body = _encode(chunk)
+        s3.put_object(Bucket=bucket, Key=key, Body=body,
+                      Metadata={"encoding": encoding},
+                      ContentType="application/octet-stream")
+        return len(body)
+
+    recipe: list[list] = []
+    seen: set[str] = set()
+    slots = threading.BoundedSemaphore(2 * workers)
+    futures = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        for chunk in iter_chunks(stream):
+            sha = hashlib.sha256(chunk).hexdigest()
+            recipe.append([sha, len(chunk)])
+            if sha in seen:
+                continue
+            seen.add(sha)
+            slots.acquire()
+            future = pool.submit(put, sha, chunk)
+            future.add_done_callback(lambda _: slots.release())
+            futures.append(future)
+        sizes = [f.result() for f in futures]
+
+    body = {
+        "schema_version": 1,
+        "chunk_prefix": CHUNK_PREFIX,
+        "size": sum(size for _, size in recipe),
+        "chunks": recipe,
+    }
+    s3.put_object(Bucket=bucket, Key=recipe_key, Body=json.dumps(body).encode(),
+                  ContentType="application/json")
+    return {
+        "chunks": len(recipe),
+        "new_chunks": sum(1 for n in sizes if n),
+        "size": body["size"],
+        "uploaded": sum(sizes),
+    }
+
+
+class ChunkReader(io.RawIOBase):
+    """Readable stream reassembling a chunked archive, fetching up to
+    `workers` chunks ahead of the reader. Chunks already in cache_dir are
+    read locally; the rest are downloaded, verified and added to it."""
+
+    def __init__(self, s3, bucket: str, recipe: dict, cache_dir: Path | None, workers: int):
+        import concurrent.futures
+        self._s3 = s3
+        self._bucket = bucket
+        self._prefix = recipe.get("chunk_prefix", CHUNK_PREFIX)
+        self._cache_dir = cache_dir
+        if cache_dir:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.downloaded = 0
+        self.cached = 0
+        self._current = memoryview(b"")
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self._chunks = iter(recipe["chunks"])
+        self._window = [self._pool.submit(self._fetch, sha)
+                        for sha, _ in _take(self._chunks, workers)]
+
+    def _fetch(self, sha: str) -> bytes:
+        cached = self._cache_dir / sha if self._cache_dir else None
+        if cached and cached.exists():
+            with self._lock:
+                self.cached += 1
+            return cached.read_bytes()
+        resp = self._s3.get_object(Bucket=self._bucket, Key=f"{self._prefix}{sha}")
+        data = resp["Body"].read()
+        with self._lock:
+            self.downloaded += len(data)
+        if resp.get("Metadata", {}).get("encoding") == "zstd":
+            import zstandard
+            data = zstandard.ZstdDecompressor().decompress(data)
+        if hashlib.sha256(data).hexdigest() != sha:
+            raise OSError(f"chunk {sha} failed its sha256 check")
+        if cached:
+            tmp = cached.with_name(f".{sha}.{threading.get_ident()}.part")
+            tmp.write_bytes(data)
+            os.replace(tmp, cached)
+        return data
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._current:
+            if not self._window:
+                return 0
+            self._current = memoryview(self._window.pop(0).result())
+            for sha, _ in _take(self._chunks, 1):
+                self._window.append(self._pool.submit(self._fetch, sha))
+        n = min(len(b), len(self._current))
+        b[:n] = self._current[:n]
+        self._current = self._current[n:]
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+        super().close()
+
+
+def _take(it, n: int) -> list:
+    out = []
+    for item in it:
+        out.append(item)
+        if len(out) == n:
+            break
+    return out
+
+
+def open_chunked(s3, bucket: str, recipe_key: str, cache_dir: Path | None = None,
+                 *, workers: int = 8) -> io.BufferedReader:
+    """Open a chunked archive for streaming reads (raises ClientError if the
+    recipe doesn't exist). The raw ChunkReader is available as `.raw` for its
+    downloaded/cached counters."""
+    recipe = json.loads(s3.get_object(Bucket=bucket, Key=recipe_key)["Body"].read())
+    return io.BufferedReader(ChunkReader(s3, bucket, recipe, cache_dir, workers),
+                             buffer_size=1 << 20)
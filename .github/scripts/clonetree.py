@@ -0,0 +1,111 @@
+"""Copy-on-write directory snapshots for the work interpreters.
+
+The CI scripts reset a multi-gigabyte MonolithPy tree from a pristine copy
+many times per job. clone_tree() makes that copy as cheap as the filesystem
+allows:
+
+  - macOS/APFS: one clonefile(2) call clones the whole hierarchy, so the
+    cost is metadata only and blocks are shared until written;
+  - Linux on btrfs/XFS: every file is reflinked with the FICLONE ioctl;
+  - anything else (NTFS, ext4, tmpfs, ...): a plain shutil.copytree.
+
+Hardlink farms are deliberately not used for interpreter trees: rebuildpython
+and pip may rewrite files in place, which would silently corrupt the pristine
+tree through the shared inode. Wheels are never modified after being written,
+so link_or_clone() may hardlink those.
+"""
+
+import errno
+import os
+import platform
+import shutil
+from pathlib import Path
+
+_FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+
+
+def _clonefile(src: Path, dst: Path) -> bool:
+    """Clone src to dst with macOS clonefile(2). False if unsupported."""
+    import ctypes
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        clonefile = libc.clonefile
+    except (OSError, AttributeError):
+        return False
+    clonefile.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_uint32]
+    clonefile.restype = ctypes.c_int
+    return clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0
+
+
+def _reflink_file(src: str, dst: str) -> bool:
+    """copytree() copy_function that reflinks, falling back to copy2 per file.
+    Returns True if the file was reflinked."""
+    import fcntl
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+    except OSError:
+        shutil.copy2(src, dst)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def _reflink_supported(src: Path, dst_parent: Path) -> bool:
+    """Probe FICLONE with the first regular file of src."""
+    import fcntl
+    probe_src = next((p for p in src.rglob("*") if p.is_file() and not p.is_symlink()), None)
+    if probe_src is None:
+        return False
+    probe_dst = dst_parent / f".reflink-probe-{os.getpid()}"
+    try:
+        with open(probe_src, "rb") as fsrc, open(probe_dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        return False
+    finally:
+        probe_dst.unlink(missing_ok=True)
+
+
+def clone_tree(src: Path, dst: Path) -> str:
+    """Create dst (which must not exist) as a copy of src, as cheaply as the
+    filesystem allows. Returns the method used: "clonefile", "reflink" or
+    "copy"."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    system = platform.system()
+    if system == "Darwin":
+        if _clonefile(src, dst):
+            return "clonefile"
+        if dst.exists():
+            shutil.rmtree(dst)
+    if system == "Linux" and _reflink_supported(src, dst.parent):
+        shutil.copytree(src, dst, copy_function=_reflink_file)
+        return "reflink"
+    shutil.copytree(src, dst)
+    return "copy"
+
+
+def link_or_clone(src: Path, dst: Path) -> str:
+    """Materialize the immutable file src at dst without copying bytes where
+    possible: a hardlink, else a clone/reflink, else a copy. dst must not
+    exist. Returns the method used."""
+    if os.path.lexists(dst):
+        # Never fall through to a clone/copy that would open (and truncate)
+        # an existing, possibly hardlinked, destination.
+        raise FileExistsError(errno.EEXIST, "File exists", str(dst))
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except FileExistsError:
+        raise
+    except OSError:
+        pass
+    system = platform.system()
+    if system == "Darwin":
+        if _clonefile(src, dst):
+            return "clonefile"
+    elif system == "Linux":
+        return "reflink" if _reflink_file(str(src), str(dst)) else "copy"
+    shutil.copy2(src, dst)
+    return "copy"
@@ -8,17 +8,27 @@ transitively as dependencies of the top-level packages, so we only install
 the top-level `packages/` entries directly.
 """
 
+import concurrent.futures
+import csv
 import hashlib
+import io
 import json
+import mmap
 import os
 import platform
 import re
 import shutil
 import subprocess
 import sys
+import threading
+import time
 import zipfile
 from pathlib import Path
 
+import startup_bench
+import tracing
+from clonetree import clone_tree
+
 
 _TAG_RE = re.compile(r"^mp(?P<major>\d)(?P<minor>\d+)$")
 
@@ -51,54 +61,126 @@ def list_tests(pkg_dir: Path) -> list[Path]:
     return [pkg_dir / t for t in data.get("tests", []) if (pkg_dir / t).exists()]
 
 
-def inspect_wheels(wheel_dir: Path, top_level_names: set[str]) -> set[str]:
+INSPECT_CACHE_NAME = ".inspect-cache.json"
+
+
+def _sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                h.update(m)
+        except ValueError:
+            pass  # empty file: nothing to map, nothing to hash
+    return h.hexdigest()
+
+
+def _check_record(zf: zipfile.ZipFile, info_dir: str) -> str | None:
+    """Cross-check RECORD against the central directory without
+    decompressing anything: every listed file must be present with the
+    recorded size, and every member must be listed. Returns a problem or None."""
+    try:
+        record = zf.read(f"{info_dir}/RECORD").decode("utf-8")
+    except KeyError:
+        return "MISSING RECORD"
+    sizes = {i.filename: i.file_size for i in zf.infolist() if not i.is_dir()}
+    listed = set()
+    for row in csv.reader(io.StringIO(record)):
+        if not row:
+            continue
+        name = row[0]
+        listed.add(name)
+        if name not in sizes:
+            return f"RECORD lists missing entry: {name}"
+        if len(row) > 2 and row[2] and int(row[2]) != sizes[name]:
+            return f"SIZE MISMATCH: {name} ({sizes[name]} != RECORD {row[2]})"
+    # Signatures over RECORD can't list themselves in it (PEP 376, pip).
+    unsigned = {f"{info_dir}/RECORD.jws", f"{info_dir}/RECORD.p7s"}
+    unlisted = sorted(set(sizes) - listed - unsigned)
+    if unlisted:
+        return f"NOT IN RECORD: {unlisted[0]}"
+    return None
+
+
+def _inspect_one(path: str, verify: str, cached: dict) -> tuple[int, str, str]:
+    """Check one wheel; returns (size, sha256, status). Runs in a worker
+    process. A wheel whose (name, size, sha256) is in `cached` was already
+    found ok and is not opened again."""
+    whl = Path(path)
+    size = whl.stat().st_size
+    sha = _sha256_file(whl)
+    if cached.get(whl.name) == [size, sha]:
+        return size, sha, "ok (cached)"
+    try:
+        with zipfile.ZipFile(whl, "r") as zf:
+            info_dirs = sorted({
+                n.split("/", 1)[0]
+                for n in zf.namelist()
+                if n.split("/", 1)[0].endswith(".dist-info")
+            })
+            bad = zf.testzip() if verify == "full" else None
+            if bad is not None:
+                return size, sha, f"CORRUPT (bad entry: {bad})"
+            if not info_dirs:
+                return size, sha, "NO .dist-info DIRECTORY"
+            if len(info_dirs) > 1:
+                return size, sha, f"MULTIPLE .dist-info: {info_dirs}"
+            if verify == "record":
+                problem = _check_record(zf, info_dirs[0])
+                if problem:
+                    return size, sha, problem
+            # Read METADATA to make sure it's actually readable.
+            try:
+                md = zf.read(f"{info_dirs[0]}/METADATA")
+            except KeyError:
+                return size, sha, "MISSING METADATA"
+            return size, sha, f"ok ({len(md)} bytes metadata)"
+    except zipfile.BadZipFile as e:
+        return size, sha, f"BadZipFile: {e}"
+    except Exception as e:
+        return size, sha, f"{type(e).__name__}: {e}"
+
+
+def inspect_wheels(wheel_dir: Path, top_level_names: set[str], *,
+                   verify: str = "full", jobs: int | None = None,
+                   cache_path: Path | None = None) -> set[str]:
     """Print per-wheel sha256 + size + zipfile sanity check for every wheel
     under `wheel_dir`.  Any wheel that fails to open is flagged via
     ::error:: so the CI annotation surfaces the exact file rather than
     relying on pip's terse 'is invalid.' message.
 
+    Wheels are checked in parallel worker processes. verify="full" runs
+    ZipFile.testzip(), decompressing every member; verify="record" only
+    cross-checks RECORD against the central directory. Wheels found ok are
+    remembered in `cache_path` by (mode, name, size, sha256), so a re-run
+    over the same directory in the same mode only re-hashes them.
+
     Returns the set of top-level package names whose wheels are corrupted,
     so callers can skip them in the pip install pass instead of failing
     the whole run on one artifact-download glitch."""
     wheels = sorted(wheel_dir.rglob("*.whl"))
+    cache_path = cache_path or wheel_dir / INSPECT_CACHE_NAME
+    try:
+        cache_file = json.loads(cache_path.read_text())
+    except (OSError, ValueError):
+        cache_file = {}
+    if not isinstance(cache_file, dict):
+        cache_file = {}
+    # One section per verify mode: a "record" pass says nothing about
+    # testzip, so neither mode may satisfy or overwrite the other.
+    cache = cache_file.get(verify, {})
     bad_packages: set[str] = set()
-    print(f"\n::group::Inspecting {len(wheels)} wheel(s) in {wheel_dir}")
-    for whl in wheels:
-        size = whl.stat().st_size
-        h = hashlib.sha256()
-        with open(whl, "rb") as f:
-            for chunk in iter(lambda: f.read(1 << 20), b""):
-                h.update(chunk)
-        status = "ok"
-        try:
-            with zipfile.ZipFile(whl, "r") as zf:
-                bad = zf.testzip()
-                if bad is not None:
-                    status = f"CORRUPT (bad entry: {bad})"
-                else:
-                    info_dirs = sorted({
-                        n.split("/", 1)[0]
-                        for n in zf.namelist()
-                        if n.split("/", 1)[0].endswith(".dist-info")
-                    })
-                    if not info_dirs:
-                        status = "NO .dist-info DIRECTORY"
-                    elif len(info_dirs) > 1:
-                        status = f"MULTIPLE .dist-info: {info_dirs}"
-                    else:
-                        # Read METADATA to make sure it's actually readable.
-                        meta_path = f"{info_dirs[0]}/METADATA"
-                        try:
-                            md = zf.read(meta_path)
-                            status = f"ok ({len(md)} bytes metadata)"
-                        except KeyError:
-                            status = "MISSING METADATA"
-        except zipfile.BadZipFile as e:
-            status = f"BadZipFile: {e}"
-        except Exception as e:
-            status = f"{type(e).__name__}: {e}"
-
-        line = f"  {whl.name}: size={size} sha256={h.hexdigest()[:16]}... [{status}]"
+    print(f"\n::group::Inspecting {len(wheels)} wheel(s) in {wheel_dir} "
+          f"({verify} check)")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(_inspect_one, [str(w) for w in wheels],
+                                [verify] * len(wheels),
+                                [{w.name: cache[w.name]} if w.name in cache else {}
+                                 for w in wheels]))
+
+    ok: dict[str, list] = {}
+    for whl, (size, sha, status) in zip(wheels, results):
+        line = f"  {whl.name}: size={size} sha256={sha[:16]}... [{status}]"
         if "ok" not in status.split()[0]:
             print(f"::error::{line}")
             # Map wheel basename back to its top-level package so we can skip it.
@@ -107,8 +189,14 @@ def inspect_wheels(wheel_dir: Path, top_level_names: set[str]) -> set[str]:
             if pkg in top_level_names:
                 bad_packages.add(pkg)
         else:
+            ok[whl.name] = [size, sha]
             print(line)
     print("::endgroup::")
+    try:
+        cache_file[verify] = ok
+        cache_path.write_text(json.dumps(cache_file, indent=1, sort_keys=True))
+    except OSError as e:
+        print(f"::warning::Cannot write {cache_path}: {e}")
     return bad_packages
 
 
@@ -125,24 +213,135 @@ def run_pip_install(monolithpy: Path, wheel_dir: Path, packages: list[str]) -> b
     return rc == 0
 
 
-def run_tests(monolithpy: Path, packages_dir: Path, packages: list[str]) -> list[str]:
-    failed: list[str] = []
+def _run_test(monolithpy: Path, test_path: Path, capture: bool) -> tuple[dict, bytes]:
+    """Run one test script; returns (resource usage, captured output).
+
+    On POSIX the child is reaped with os.wait4 for its CPU time and peak
+    RSS; Windows only gets wall time."""
+    start = time.monotonic()
+    proc = subprocess.Popen(
+        [str(monolithpy), str(test_path)],
+        stdout=subprocess.PIPE if capture else None,
+        stderr=subprocess.STDOUT if capture else None,
+    )
+    output = proc.stdout.read() if capture else b""
+    usage = {"cpu_user_s": None, "cpu_sys_s": None, "peak_rss_bytes": None}
+    if hasattr(os, "wait4"):
+        _, status, ru = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        usage = {
+            "cpu_user_s": round(ru.ru_utime, 3),
+            "cpu_sys_s": round(ru.ru_stime, 3),
+            # ru_maxrss is bytes on macOS, KiB on Linux.
+            "peak_rss_bytes": ru.ru_maxrss * (1 if sys.platform == "darwin" else 1024),
+        }
+    else:
+        proc.wait()
+    if capture:
+        proc.stdout.close()
+    usage.update(rc=proc.returncode, wall_s=round(time.monotonic() - start, 3))
+    return usage, output
+
+
+def run_tests(monolithpy: Path, packages_dir: Path, packages: list[str], *,
+              jobs: int = 1, report: Path | None = None) -> list[str]:
+    """Run every declared test, `jobs` at a time. With jobs > 1 each test's
+    output is buffered and printed as one log group when it finishes.
+    Per-test wall time, CPU time and peak RSS go to `report` as JSON."""
+    queue: list[tuple[str, Path]] = []
     for pkg in packages:
         tests = list_tests(packages_dir / pkg)
         if not tests:
             print(f"::notice::{pkg}: no tests declared, skipping")
             continue
-        for test_path in tests:
-            label = f"{pkg}/{test_path.name}"
-            print(f"\n::group::Running test: {label}")
-            rc = subprocess.call([str(monolithpy), str(test_path)])
+        queue.extend((pkg, test_path) for test_path in tests)
+
+    order = {f"{pkg}/{t.name}": i for i, (pkg, t) in enumerate(queue)}
+    capture = jobs > 1
+    print_lock = threading.Lock()
+    failed: list[str] = []
+    results: list[dict] = []
+
+    def run(pkg: str, test_path: Path) -> None:
+        label = f"{pkg}/{test_path.name}"
+        if not capture:
+            print(f"\n::group::Running test: {label}", flush=True)
+        with tracing.span("run_test", pkg=pkg, test=test_path.name):
+            usage, output = _run_test(monolithpy, test_path, capture)
+        with print_lock:
+            if capture:
+                print(f"\n::group::Running test: {label}", flush=True)
+                sys.stdout.buffer.write(output)
+                sys.stdout.flush()
             print("::endgroup::")
-            if rc != 0:
-                print(f"::error::Test failed: {label} (exit {rc})")
+            rss = usage["peak_rss_bytes"]
+            stats = f"{usage['wall_s']:.1f}s wall" + (
+                f", {usage['cpu_user_s'] + usage['cpu_sys_s']:.1f}s CPU, "
+                f"{rss / 2**20:.0f} MiB peak RSS" if rss is not None else "")
+            if usage["rc"] != 0:
+                print(f"::error::Test failed: {label} (exit {usage['rc']}; {stats})")
                 failed.append(label)
             else:
-                print(f"::notice::Test passed: {label}")
-    return failed
+                print(f"::notice::Test passed: {label} ({stats})")
+            results.append({"package": pkg, "test": test_path.name, **usage})
+
+    if jobs > 1:
+        print(f"Running {len(queue)} test(s) on {jobs} workers")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+            for future in [pool.submit(run, pkg, t) for pkg, t in queue]:
+                future.result()
+    else:
+        for pkg, test_path in queue:
+            run(pkg, test_path)
+
+    if report:
+        report.parent.mkdir(parents=True, exist_ok=True)
+        results.sort(key=lambda r: order[f"{r['package']}/{r['test']}"])
+        report.write_text(json.dumps({"jobs": jobs, "tests": results}, indent=2))
+        print(f"Wrote per-test resource report to {report}")
+    # Keep the failure summary in test order regardless of completion order.
+    return sorted(failed, key=order.__getitem__)
+
+
+def run_benchmark(monolithpy: Path, packages: list[str], args) -> list[str]:
+    """Run startup_bench against the final interpreter, write args.benchmark
+    and return the regressions against args.benchmark_baseline, if any."""
+    print(f"\n::group::Startup and import-time benchmark ({args.benchmark_repeat} samples each)")
+    try:
+        with tracing.span("benchmark"):
+            results = startup_bench.run_benchmark(monolithpy, packages, args.benchmark_repeat)
+    except (subprocess.CalledProcessError, RuntimeError, OSError, ValueError) as e:
+        # Never let the benchmark take down the run or hide its summary.
+        if isinstance(e, subprocess.CalledProcessError):
+            args_shown = " ".join(str(a).strip().splitlines()[0] for a in e.cmd[1:3])
+            e = f"`{args_shown} ...` exited with {e.returncode}"
+        print("::endgroup::")
+        print(f"::warning::Startup/import benchmark could not run: {e}")
+        return []
+    for name, m in results["metrics"].items():
+        print(f"  {name}: median {m['median_ms']:.1f} ms "
+              f"(min {m['min_ms']:.1f}, stdev {m['stdev_ms']:.1f})")
+    print("::endgroup::")
+    for module in results["import_failed"]:
+        print(f"::warning::Benchmark: `import {module}` failed; not measured")
+    args.benchmark.parent.mkdir(parents=True, exist_ok=True)
+    args.benchmark.write_text(json.dumps(results, indent=2, sort_keys=True))
+    print(f"Wrote benchmark results to {args.benchmark}")
+
+    if not args.benchmark_baseline:
+        return []
+    if not args.benchmark_baseline.exists():
+        print(f"::notice::No benchmark baseline at {args.benchmark_baseline}; "
+              f"{args.benchmark} can be committed as one")
+        return []
+    baseline = json.loads(args.benchmark_baseline.read_text())
+    regressions = startup_bench.compare(results, baseline, args.benchmark_tolerance)
+    for line in regressions:
+        print(f"::error::Benchmark regression: {line}")
+    if not regressions:
+        print(f"::notice::Startup and import times within {args.benchmark_tolerance:.0%} "
+              f"of {args.benchmark_baseline}")
+    return regressions
 
 
 def dump_loaded_libraries(monolithpy: Path) -> None:
@@ -215,7 +414,33 @@ def main() -> int:
                         default=os.environ.get("MONOLITHPY_TAG"),
                         help="MonolithPy Python version tag (e.g. 'mp313', 'mp314'). "
                              "Defaults to $MONOLITHPY_TAG.")
+    parser.add_argument("--verify", choices=("full", "record"), default="full",
+                        help="Wheel integrity check: 'full' decompresses every member "
+                             "(testzip); 'record' only checks RECORD against the zip "
+                             "central directory.")
+    parser.add_argument("--inspect-jobs", type=int, default=None,
+                        help="Worker processes for the wheel check (default: CPU count).")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Tests to run concurrently (default: 1). Above 1, "
+                             "each test's output is buffered until it finishes.")
+    parser.add_argument("--test-report", type=Path, metavar="FILE",
+                        help="Write per-test wall time, CPU time and peak RSS as JSON to FILE.")
+    parser.add_argument("--benchmark", type=Path, metavar="FILE",
+                        help="Benchmark interpreter startup and per-package import "
+                             "time after the final rebuild; write results as JSON to FILE.")
+    parser.add_argument("--benchmark-baseline", type=Path, metavar="FILE",
+                        help="Fail when a --benchmark median regresses against this "
+                             "earlier results file.")
+    parser.add_argument("--benchmark-tolerance", type=float, default=0.25,
+                        help="Allowed slowdown over the baseline median, as a "
+                             "fraction (default: 0.25).")
+    parser.add_argument("--benchmark-repeat", type=int, default=10,
+                        help="Samples per benchmark measurement (default: 10).")
+    parser.add_argument("--trace", type=Path, metavar="FILE",
+                        help="Write a Chrome trace-event JSON timeline of every phase to FILE.")
     args = parser.parse_args()
+    if args.trace:
+        tracing.enable(args.trace, process_name="final_test")
 
     if not args.monolithpy_tag:
         print("::error::--monolithpy-tag or MONOLITHPY_TAG env var is required", file=sys.stderr)
@@ -234,9 +459,11 @@ def main() -> int:
     # Work on a clean copy of the monolithpy artifact so test side effects
     # don't leak between runs in the same job.
     work_dir = root / "monolithpy_final"
-    if work_dir.exists():
-        shutil.rmtree(work_dir)
-    shutil.copytree(args.monolithpy, work_dir)
+    with tracing.span("clone_tree", dst=work_dir.name):
+        if work_dir.exists():
+            shutil.rmtree(work_dir)
+        method = clone_tree(args.monolithpy, work_dir)
+    print(f"Cloned {args.monolithpy} -> {work_dir} via {method}")
 
     monolithpy = get_monolithpy_executable(work_dir, python_version)
     if not monolithpy.exists():
@@ -245,8 +472,9 @@ def main() -> int:
 
     # Rebuild the python binary so any prior state from the artifact is discarded.
     try:
-        subprocess.run([str(monolithpy), "-m", "rebuildpython"],
-                       capture_output=True, check=False)
+        with tracing.span("run_rebuild"):
+            subprocess.run([str(monolithpy), "-m", "rebuildpython"],
+                           capture_output=True, check=False)
     except Exception:
         pass
 
@@ -257,28 +485,44 @@ def main() -> int:
     print(f"Installing {len(packages)} top-level package(s): {packages}")
 
     top_level_set = set(packages)
-    bad = inspect_wheels(args.wheels, top_level_set)
+    with tracing.span("inspect_wheels"):
+        bad = inspect_wheels(args.wheels, top_level_set,
+                             verify=args.verify, jobs=args.inspect_jobs)
     if bad:
         print(f"::warning::Skipping {len(bad)} package(s) with corrupted wheel(s): {sorted(bad)}")
         packages = [p for p in packages if p not in bad]
 
-    if not run_pip_install(monolithpy, args.wheels, packages):
+    with tracing.span("pip_install"):
+        installed = run_pip_install(monolithpy, args.wheels, packages)
+    if not installed:
         print("::error::pip install failed", file=sys.stderr)
         return 1
 
     # rebuild again after install so all native extensions are linked in.
-    subprocess.run([str(monolithpy), "-m", "rebuildpython"],
-                   capture_output=True, check=False)
+    with tracing.span("run_rebuild"):
+        subprocess.run([str(monolithpy), "-m", "rebuildpython"],
+                       capture_output=True, check=False)
+
+    failed = run_tests(monolithpy, packages_dir, packages,
+                       jobs=args.jobs, report=args.test_report)
 
-    failed = run_tests(monolithpy, packages_dir, packages)
+    regressions: list[str] = []
+    if args.benchmark and failed:
+        print("::notice::Skipping the startup/import benchmark because tests failed")
+    elif args.benchmark:
+        regressions = run_benchmark(monolithpy, packages, args)
 
-    dump_loaded_libraries(monolithpy)
+    with tracing.span("dump_loaded_libraries"):
+        dump_loaded_libraries(monolithpy)
 
     if failed:
         print(f"\n::error::{len(failed)} test(s) failed:")
         for f in failed:
             print(f"  - {f}")
         return 1
+    if regressions:
+        print(f"\n::error::{len(regressions)} startup/import benchmark regression(s)")
+        return 1
 
     print(f"\n::notice::All tests passed across {len(packages)} package(s)")
     return 0
@@ -5,9 +5,38 @@ Refuses to run unless `builds/<full>/MANIFEST.json` is present — this guards
 against promoting a partial upload.  Uses server-side CopyObject, so no wheel
 bytes transit the runner.  Overwrites any existing keys in `main/` (by design:
 `main/` is a latest-known-good snapshot, not an archive).
+
+Copies run on a thread pool (--jobs). A key whose `main/` copy already has
+the same size and ETag, or, for wheels, the same sha256 in main's simple
+index, is skipped, so re-promoting an unchanged wheel set costs a listing.
+
+The run's own `simple/` index only lists that run's wheels, so it is not
+copied; instead each promoted project's page in `main/simple/` is merged
+with the run's files and rewritten, along with the root project list (see
+simple_index.py). If `main/CURRENT` was set, the pages link into a builds/
+prefix, so `main/simple/` is rebuilt from the wheels in `main/` instead.
+
+With --pointer no wheel is copied: `main/CURRENT` is pointed at the run's
+immutable `builds/<run>/` prefix with one conditional PUT, which fails
+rather than overwrite a concurrent promotion. `main/simple/` is then
+regenerated from the run's MANIFEST.json with URLs into that prefix (and
+pages of projects it doesn't have are removed), so pip consumers of the
+stable `main/simple/` URL follow the pointer. Re-running a pointer
+promotion of the current run only regenerates the index. Pointed-at
+builds/ prefixes must be kept out of any expiry rule. A copy promotion
+removes CURRENT, since `main/` is then served from copies again.
+
+Every promotion and rollback is recorded as its own object under
+`main/promotions/<YYYY>/<MM>/`, so the audit log never has to be read to
+append to it. --rollback replays the pointer entries of that log (promote
+pushes, rollback pops) and moves CURRENT to the run below the current one,
+so repeated rollbacks walk back through every pointer promotion since the
+last copy promotion. The older single-file `main/PROMOTIONS.jsonl` is left
+as is.
 """
 
 import argparse
+import concurrent.futures
 import datetime
 import json
 import os
@@ -17,8 +46,13 @@ import boto3
 from botocore.config import Config
 from botocore.exceptions import ClientError, ParamValidationError
 
+import simple_index
+
+POINTER_KEY = "main/CURRENT"
+AUDIT_PREFIX = "main/promotions/"
 
-def make_s3_client():
+
+def make_s3_client(max_pool_connections: int = 10):
     endpoint = os.environ["S3_ENDPOINT"]
     region = os.environ["S3_REGION"]
     access_key = os.environ["S3_ACCESS_KEY_ID"]
@@ -29,7 +63,8 @@ def make_s3_client():
         region_name=region,
         aws_access_key_id=access_key,
         aws_secret_access_key=secret_key,
-        config=Config(retries={"max_attempts": 10, "mode": "adaptive"}),
+        config=Config(retries={"max_attempts": 10, "mode": "adaptive"},
+                      max_pool_connections=max_pool_connections),
     )
 
 
@@ -78,13 +113,60 @@ def load_manifest(s3, bucket: str, prefix: str) -> dict:
     return json.loads(resp["Body"].read())
 
 
-def list_keys(s3, bucket: str, prefix: str) -> list[str]:
+def list_objects(s3, bucket: str, prefix: str) -> dict[str, tuple[str, int]]:
+    """{key: (ETag, size)} for every object under `prefix/`."""
     paginator = s3.get_paginator("list_objects_v2")
-    keys: list[str] = []
+    objects: dict[str, tuple[str, int]] = {}
     for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/"):
         for obj in page.get("Contents", []) or []:
-            keys.append(obj["Key"])
-    return keys
+            objects[obj["Key"]] = (obj["ETag"], obj["Size"])
+    return objects
+
+
+def main_index_files(s3, bucket: str, projects, executor) -> dict[str, dict[str, dict]]:
+    """{norm: {filename: file entry}} from main/simple/ for the given
+    projects, keeping only entries that link into main/ itself. After a
+    pointer promotion the pages link into builds/<run>/ instead, and their
+    hashes say nothing about the bytes in main/."""
+    def load(norm: str) -> tuple[str, dict[str, dict]]:
+        page = simple_index.load_json(s3, bucket, f"main/simple/{norm}/index.json") or {}
+        return norm, {f["filename"]: f for f in page.get("files", [])
+                      if f.get("url") == f"../../{norm}/{f['filename']}"}
+
+    return dict(executor.map(load, projects))
+
+
+def promoted_sha256(s3, bucket: str, projects, executor) -> dict[str, str]:
+    """{main/<norm>/<wheel>: sha256} for the given projects, from the main/
+    simple index. A server-side copy of a multipart upload gets a new
+    ETag, so the ETag alone misses wheels that are in fact identical."""
+    return {
+        f"main/{norm}/{name}": f["hashes"]["sha256"]
+        for norm, files in main_index_files(s3, bucket, projects, executor).items()
+        for name, f in files.items() if "sha256" in f.get("hashes", {})
+    }
+
+
+def main_projects(s3, bucket: str, objects: dict[str, tuple[str, int]],
+                  projects: dict[str, dict[str, dict]], executor) -> dict[str, dict[str, dict]]:
+    """{norm: {filename: file entry}} for every wheel in `objects` (main/
+    keys), taking entries from `projects` (the promoted run), then from
+    main/simple/ pages that link into main/, else listing the wheel by size
+    only."""
+    wheels: dict[str, dict[str, int]] = {}
+    for key, (_, size) in objects.items():
+        parts = key.split("/")
+        if len(parts) == 3 and parts[2].endswith(".whl"):
+            wheels.setdefault(parts[1], {})[parts[2]] = size
+    indexed = main_index_files(s3, bucket, wheels, executor)
+    result: dict[str, dict[str, dict]] = {}
+    for norm, files in wheels.items():
+        result[norm] = {
+            name: projects.get(norm, {}).get(name) or indexed[norm].get(name)
+            or {"filename": name, "url": f"../../{norm}/{name}", "hashes": {}, "size": size}
+            for name, size in files.items()
+        }
+    return result
 
 
 def copy_object(s3, bucket: str, src_key: str, dst_key: str) -> None:
@@ -96,90 +178,221 @@ def copy_object(s3, bucket: str, src_key: str, dst_key: str) -> None:
     )
 
 
-def _put_log_without_cas(s3, extra: dict, reason: str) -> None:
-    """Write the promotion log without the IfMatch compare-and-swap.
+def _utc_now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _iso(ts: datetime.datetime) -> str:
+    return ts.isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+def append_promotion_log(s3, bucket: str, entry: dict, ts: datetime.datetime) -> str:
+    """Record one audit entry as its own object; returns its key.
+
+    Sharded by month and named by timestamp and source run, so appending
+    never reads (or races on) earlier entries and a month lists in order;
+    microseconds in the name keep that order within one second."""
+    source = entry["source_run"].replace("/", "_")
+    key = f"{AUDIT_PREFIX}{ts:%Y/%m}/{ts:%Y%m%dT%H%M%S.%fZ}-{entry['action']}-{source}.json"
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps(entry, sort_keys=True).encode("utf-8"),
+        ContentType="application/json",
+    )
+    return key
+
+
+def read_pointer(s3, bucket: str) -> tuple[dict | None, str | None]:
+    """Return (main/CURRENT contents, ETag), or (None, None) if unset."""
+    try:
+        resp = s3.get_object(Bucket=bucket, Key=POINTER_KEY)
+    except ClientError as e:
+        code = e.response.get("Error", {}).get("Code", "")
+        if code in ("NoSuchKey", "404"):
+            return None, None
+        raise
+    return json.loads(resp["Body"].read()), resp["ETag"]
+
+
+def _put_pointer_without_cas(s3, extra: dict, reason: str) -> None:
+    """Write main/CURRENT without the compare-and-swap.
 
     Used when conditional PutObject is unavailable — either the installed
-    botocore predates the IfMatch parameter, or the S3-compatible endpoint
-    doesn't implement conditional writes. The append is the final audit step
-    after every wheel has already been server-side-copied, so it must not fail
-    the promotion; dropping CAS only loses protection against the (manual,
-    serial) case of two promotions racing on PROMOTIONS.jsonl.
+    botocore predates the IfMatch/IfNoneMatch parameters, or the S3-compatible
+    endpoint doesn't implement conditional writes. Promotions are manual and
+    serial, so this only loses protection against two of them racing.
     """
     extra.pop("IfMatch", None)
-    print(
-        f"::warning::{reason}; appending PROMOTIONS.jsonl "
-        f"without compare-and-swap"
-    )
+    extra.pop("IfNoneMatch", None)
+    print(f"::warning::{reason}; writing {POINTER_KEY} without compare-and-swap")
     s3.put_object(**extra)
 
 
-def append_promotion_log(
-    s3, bucket: str, entry: dict, *, max_attempts: int = 5
-) -> None:
-    key = "main/PROMOTIONS.jsonl"
-    new_line = json.dumps(entry, sort_keys=True) + "\n"
-    for attempt in range(max_attempts):
-        try:
-            resp = s3.get_object(Bucket=bucket, Key=key)
-            existing = resp["Body"].read()
-            etag = resp["ETag"]
-        except ClientError as e:
-            code = e.response.get("Error", {}).get("Code", "")
-            if code in ("NoSuchKey", "404"):
-                existing = b""
-                etag = None
-            else:
-                raise
-
-        body = existing + new_line.encode("utf-8")
-        extra = {
-            "Bucket": bucket,
-            "Key": key,
-            "Body": body,
-            "ContentType": "application/x-ndjson",
-        }
-        if etag:
-            extra["IfMatch"] = etag
-        try:
-            s3.put_object(**extra)
-            return
-        except ParamValidationError:
-            # Installed botocore predates S3 conditional PutObject (the IfMatch
-            # parameter, ~botocore 1.35.60) — the CAS is rejected client-side.
-            _put_log_without_cas(
-                s3, extra, "botocore too old for conditional PutObject (IfMatch)"
+def write_pointer(s3, bucket: str, pointer: dict, etag: str | None) -> None:
+    """Replace main/CURRENT if it still has `etag` (or create it if None)."""
+    extra = {
+        "Bucket": bucket,
+        "Key": POINTER_KEY,
+        "Body": json.dumps(pointer, indent=2, sort_keys=True).encode("utf-8"),
+        "ContentType": "application/json",
+        "CacheControl": "no-cache",
+    }
+    if etag:
+        extra["IfMatch"] = etag
+    else:
+        extra["IfNoneMatch"] = "*"
+    try:
+        s3.put_object(**extra)
+    except ParamValidationError:
+        # Installed botocore predates S3 conditional PutObject (~1.35.60).
+        _put_pointer_without_cas(
+            s3, extra, "botocore too old for conditional PutObject"
+        )
+    except ClientError as e:
+        code = e.response.get("Error", {}).get("Code", "")
+        if code in ("PreconditionFailed", "412", "ConditionalRequestConflict", "409"):
+            raise SystemExit(
+                f"::error::{POINTER_KEY} changed while promoting; "
+                f"re-run against the new state"
+            )
+        if code in ("NotImplemented", "501"):
+            _put_pointer_without_cas(
+                s3, extra, "endpoint does not implement conditional PutObject"
             )
             return
-        except ClientError as e:
-            code = e.response.get("Error", {}).get("Code", "")
-            if code in ("PreconditionFailed", "412") and attempt < max_attempts - 1:
-                continue
-            if code in ("NotImplemented", "501") and "IfMatch" in extra:
-                # The S3-compatible endpoint doesn't implement conditional
-                # PutObject (it rejects the If-Match header server-side).
-                _put_log_without_cas(
-                    s3, extra,
-                    "endpoint does not implement conditional PutObject (IfMatch)",
-                )
-                return
-            raise
-    raise SystemExit("::error::Failed to append PROMOTIONS.jsonl after retries")
+        raise
+
+
+def pointer_history(s3, bucket: str, executor) -> list[str]:
+    """Replay the audit log into the stack of pointed-at prefixes, oldest
+    first; its last element is what CURRENT should point at."""
+    paginator = s3.get_paginator("list_objects_v2")
+    keys = [obj["Key"]
+            for page in paginator.paginate(Bucket=bucket, Prefix=AUDIT_PREFIX)
+            for obj in page.get("Contents", []) or []]
+    # Shard keys sort chronologically (YYYY/MM/<timestamp>-...).
+    entries = executor.map(lambda key: simple_index.load_json(s3, bucket, key) or {},
+                           sorted(keys))
+    stack: list[str] = []
+    for entry in entries:
+        if entry.get("layout") == "copy":
+            stack = []
+        elif entry.get("action") == "promote":
+            stack.append(entry.get("prefix") or f"builds/{entry['source_run']}")
+        elif entry.get("action") == "rollback" and stack:
+            stack.pop()
+    return stack
+
+
+def regenerate_main_index(s3, bucket: str, src_prefix: str, manifest: dict,
+                          executor) -> None:
+    """Rewrite main/simple/ to list exactly src_prefix's wheels, linking into
+    src_prefix (three levels up from main/simple/<norm>/ is the bucket root)."""
+    projects = simple_index.manifest_projects(manifest, base=f"../../../{src_prefix}")
+    stale = simple_index.replace_index(s3, bucket, "main", projects, executor)
+    print(f"Regenerated main/simple/ against {src_prefix}/: {len(projects)} project(s)"
+          + (f", removed {len(stale)} stale: {', '.join(sorted(stale))}" if stale else ""))
+
+
+def promote_pointer(s3, bucket: str, src_prefix: str, manifest: dict, args,
+                    executor) -> int:
+    """Point main/CURRENT at src_prefix (see --pointer / --rollback)."""
+    current, etag = read_pointer(s3, bucket)
+    previous = current["prefix"] if current else None
+    print(f"{POINTER_KEY}: {previous or '(unset)'}  ->  {src_prefix}")
+    if previous == src_prefix:
+        if args.dry_run:
+            print("\n::notice::Dry run — no changes made.")
+            return 0
+        # Still regenerate: a previous run may have died between the two.
+        regenerate_main_index(s3, bucket, src_prefix, manifest, executor)
+        print(f"\n::notice::{src_prefix}/ is already current; index regenerated.")
+        return 0
+
+    has_index = simple_index.load_json(s3, bucket, f"{src_prefix}/simple/index.json")
+    if not has_index:
+        print(f"{src_prefix}/simple/ is missing (staged before simple indexes); "
+              f"it will be generated from MANIFEST.json")
+
+    if args.dry_run:
+        print("\n::notice::Dry run — no changes made.")
+        return 0
+
+    if not has_index:
+        simple_index.write_index(s3, bucket, src_prefix,
+                                 simple_index.manifest_projects(manifest), executor)
+
+    ts = _utc_now()
+    action = "rollback" if args.rollback else "promote"
+    pointer = {
+        "prefix": src_prefix,
+        "simple_index": f"{src_prefix}/simple/",
+        "run_id": manifest.get("run_id"),
+        "commit_sha": manifest.get("commit_sha"),
+        "ref": manifest.get("ref"),
+        "promoted_at": _iso(ts),
+        "promoter": args.promoter,
+        "previous": previous,
+    }
+    write_pointer(s3, bucket, pointer, etag)
+    regenerate_main_index(s3, bucket, src_prefix, manifest, executor)
+    log_key = append_promotion_log(s3, bucket, {
+        "ts": _iso(ts),
+        "action": action,
+        "layout": "pointer",
+        "prefix": src_prefix,
+        "source_run": src_prefix.removeprefix("builds/"),
+        "previous": previous,
+        "commit_sha": manifest.get("commit_sha"),
+        "ref": manifest.get("ref"),
+        "promoter": args.promoter,
+    }, ts)
+    print(f"Recorded {log_key}")
+    print(f"\n::notice::{POINTER_KEY} now points at {src_prefix}/ ({action})")
+    return 0
 
 
 def main() -> int:
     parser = argparse.ArgumentParser()
-    parser.add_argument("--source-run", required=True,
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--source-run",
                         help="builds/<source-run>/ prefix; may be <id>-<sha> or just <id>")
+    target.add_argument("--rollback", action="store_true",
+                        help="Point main/CURRENT back at the run promoted before the "
+                             "current one, per the audit log; repeatable "
+                             "(implies --pointer).")
+    parser.add_argument("--pointer", action="store_true",
+                        help="Promote by pointing main/CURRENT at the run instead "
+                             "of copying it into main/.")
     parser.add_argument("--dry-run", action="store_true")
     parser.add_argument("--promoter", default=os.environ.get("GITHUB_ACTOR", "unknown"))
+    parser.add_argument("--jobs", type=int, default=16,
+                        help="Concurrent server-side copies (default: 16).")
     args = parser.parse_args()
 
     bucket = os.environ["S3_BUCKET"]
-    s3 = make_s3_client()
-
-    src_prefix = resolve_source_prefix(s3, bucket, args.source_run)
-    print(f"Resolved source: {src_prefix}/")
+    s3 = make_s3_client(max_pool_connections=args.jobs)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs)
+
+    if args.rollback:
+        current, _ = read_pointer(s3, bucket)
+        if not current:
+            raise SystemExit(f"::error::{POINTER_KEY} is not set; nothing to roll back")
+        history = pointer_history(s3, bucket, executor)
+        if not history or history[-1] != current["prefix"]:
+            raise SystemExit(
+                f"::error::The audit log under {AUDIT_PREFIX} does not end at "
+                f"{current['prefix']}; promote explicitly with --pointer --source-run"
+            )
+        if len(history) < 2:
+            raise SystemExit("::error::No earlier pointer promotion to roll back to")
+        src_prefix = history[-2]
+        print(f"Pointer history: {' -> '.join(history)}")
+        print(f"Rolling back to: {src_prefix}/")
+    else:
+        src_prefix = resolve_source_prefix(s3, bucket, args.source_run)
+        print(f"Resolved source: {src_prefix}/")
 
     manifest = load_manifest(s3, bucket, src_prefix)
     print(
@@ -189,41 +402,95 @@ def main() -> int:
         f"uploaded_at={manifest.get('uploaded_at')}"
     )
 
-    all_keys = list_keys(s3, bucket, src_prefix)
+    if args.pointer or args.rollback:
+        result = promote_pointer(s3, bucket, src_prefix, manifest, args, executor)
+        executor.shutdown()
+        return result
+
+    src_objects = list_objects(s3, bucket, src_prefix)
+    dst_objects = list_objects(s3, bucket, "main")
+    projects = simple_index.manifest_projects(manifest)
+    src_sha256 = {
+        f"main/{norm}/{name}": f["hashes"]["sha256"]
+        for norm, files in projects.items()
+        for name, f in files.items() if "sha256" in f["hashes"]
+    }
+    dst_sha256 = promoted_sha256(s3, bucket, projects, executor)
+
     copies: list[tuple[str, str]] = []
-    for src in all_keys:
+    unchanged: list[str] = []
+    for src, (etag, size) in src_objects.items():
         rel = src[len(src_prefix) + 1:]
-        if rel == "MANIFEST.json":
+        if rel == "MANIFEST.json" or rel.startswith("simple/"):
             continue
         dst = f"main/{rel}"
+        if dst in dst_objects and dst_objects[dst][1] == size and (
+            dst_objects[dst][0] == etag
+            or (dst in src_sha256 and dst_sha256.get(dst) == src_sha256[dst])
+        ):
+            unchanged.append(dst)
+            continue
         copies.append((src, dst))
 
-    print(f"\nPlanned copies: {len(copies)}")
+    print(f"\nPlanned copies: {len(copies)} ({len(unchanged)} identical in main/, skipped)")
     for src, dst in copies:
         print(f"  {src}  ->  {dst}")
+    print(f"Simple index pages to merge into main/simple/: {len(projects)}")
 
     if args.dry_run:
         print("\n::notice::Dry run — no changes made.")
         return 0
 
-    print(f"\nExecuting {len(copies)} copies...")
-    for i, (src, dst) in enumerate(copies, 1):
-        copy_object(s3, bucket, src, dst)
+    print(f"\nExecuting {len(copies)} copies on {args.jobs} threads...")
+    futures = [executor.submit(copy_object, s3, bucket, src, dst) for src, dst in copies]
+    for i, future in enumerate(concurrent.futures.as_completed(futures), 1):
+        future.result()
         if i % 20 == 0 or i == len(copies):
             print(f"  {i}/{len(copies)} done")
-
+    copied_bytes = sum(src_objects[src][1] for src, _ in copies)
+    skipped_bytes = sum(dst_objects[dst][1] for dst in unchanged)
+    print(f"Copied {len(copies)} object(s) ({copied_bytes} bytes), skipped "
+          f"{len(unchanged)} identical object(s) ({skipped_bytes} bytes)")
+
+    # After the copies, so no page links a wheel that isn't in main/ yet.
+    current, _ = read_pointer(s3, bucket)
+    if current:
+        # The pages link into the pointed-at builds/ prefix, which may expire
+        # once CURRENT is gone; list only what main/ actually holds.
+        print(f"\nRebuilding simple index from main/ (was against {current['prefix']}/)...")
+        in_main = dict(dst_objects)
+        in_main.update({dst: src_objects[src] for src, dst in copies})
+        stale = simple_index.replace_index(
+            s3, bucket, "main", main_projects(s3, bucket, in_main, projects, executor),
+            executor)
+        if stale:
+            print(f"Removed {len(stale)} stale project page(s): {', '.join(sorted(stale))}")
+    else:
+        print("\nMerging simple index...")
+        simple_index.merge_index(s3, bucket, "main", projects, executor)
+    executor.shutdown()
+
+    if current:
+        # main/ is served from copies again; a stale pointer would contradict it.
+        s3.delete_object(Bucket=bucket, Key=POINTER_KEY)
+        print(f"Removed {POINTER_KEY} (was {current['prefix']}/)")
+
+    ts = _utc_now()
     entry = {
-        "ts": datetime.datetime.now(datetime.timezone.utc)
-        .isoformat(timespec="seconds")
-        .replace("+00:00", "Z"),
+        "ts": _iso(ts),
+        "action": "promote",
+        "layout": "copy",
         "source_run": src_prefix.removeprefix("builds/"),
         "commit_sha": manifest.get("commit_sha"),
         "ref": manifest.get("ref"),
         "promoter": args.promoter,
-        "files_promoted": len(copies),
+        "files_promoted": len(copies) + len(unchanged),
+        "files_copied": len(copies),
+        "bytes_copied": copied_bytes,
     }
-    append_promotion_log(s3, bucket, entry)
-    print(f"\n::notice::Promoted {len(copies)} file(s) from {src_prefix}/ to main/")
+    print(f"Recorded {append_promotion_log(s3, bucket, entry, ts)}")
+    print(f"\n::notice::Promoted {len(copies) + len(unchanged)} file(s) from "
+          f"{src_prefix}/ to main/ ({len(copies)} copied, {len(unchanged)} already identical)")
     return 0
 
 
@@ -6,19 +6,76 @@ Two operations mirroring actions/cache/{restore,save}:
     restore --path DIR --key KEY [--restore-keys KEY1 KEY2 ...]
     save    --path DIR --key KEY
 
-Cache objects live at the root of the bucket, keyed as `<key>.tar.gz`.
+Cache objects live at the root of the bucket, keyed as `<key>.tar.zst`, or
+`<key>.tar` when the directory is almost all already-compressed wheels.
+Both directions stream: save pipes tar (through multithreaded zstd) into a
+multipart upload and restore extracts as the bytes arrive, so no archive
+copy touches disk. Legacy `<key>.tar.gz` objects still restore.
+
 Restore tries the exact key first, then each restore-key as a prefix
 match (picking the most recently modified object when multiple match).
 Misses are silent — the path simply isn't populated.
+
+With --index-prefix, save also records the key in a small index object,
+`cache-index/<prefix>.json`, updated with conditional (If-Match) writes,
+and restore resolves every restore-key against that index with one GET
+instead of listing the bucket. Restore falls back to listing only when the
+index doesn't exist yet.
+
+save --chunked stores the tar in the content-defined chunk store instead
+(see chunkstore.py), as `<key>.chunks.json` plus shared `chunks/<sha256>`
+objects, so a new key only uploads chunks no earlier archive had. Restore
+handles either kind and keeps fetched chunks in --chunk-cache.
+
+Per-entry mode stores each build_and_test.py cache entry separately instead
+of one tarball per tier:
+
+    wheel-markers/<cache_key>.marker   # {wheel_name: sha256}, written last
+    wheel-markers/<cache_key>.meta     # {pkg, cost, saved, atime}
+    wheel-objects/<sha256>.whl         # shared by every marker that uses it
+
+build_and_test.py --s3-cache fetches exactly the entries it needs via
+fetch_entry() and pushes new ones via push_entry(); `save-entries` uploads
+every local entry the bucket doesn't have yet.
+
+`gc --budget SIZE` shrinks a local cache directory (--path) and/or the
+per-entry store in the bucket (--remote) to SIZE bytes. The `.meta`
+sidecar of each entry is written by build_and_test.py on save and its atime
+refreshed on restore. Entries are evicted in descending order of
+idle time / (rebuild cost + 1 min), so an hour-long scipy build outlives a
+five-second certifi build last used at the same time. A wheel is deleted
+once no surviving marker references it.
 """
 
 import argparse
+import datetime
+import hashlib
+import json
 import os
 import sys
 import tarfile
 import tempfile
+import threading
+import time
+from collections import Counter
 from pathlib import Path
 
+import chunkstore
+
+INDEX_PREFIX = "cache-index/"
+MARKER_PREFIX = "wheel-markers/"
+OBJECT_PREFIX = "wheel-objects/"
+
+# Refresh a remote entry's atime at most this often, so hits don't turn
+# into a PUT each.
+_TOUCH_INTERVAL = 24 * 3600
+# Added to every entry's rebuild cost so near-free builds don't all score
+# infinitely evictable.
+_COST_FLOOR = 60.0
+# Remote objects younger than this are never treated as orphans: a concurrent
+# push_entry uploads wheels before their marker.
+_ORPHAN_GRACE = 6 * 3600
+
 
 def s3_client():
     import boto3
@@ -37,8 +94,32 @@ def s3_client():
     )
 
 
-def object_key(key: str) -> str:
-    return f"{key}.tar.gz"
+# Newest format first. `.tar` is the uncompressed "store" format picked for
+# payloads that are already compressed; `.tar.gz` is what older saves wrote;
+# `.chunks.json` is the recipe of a tar stored in the chunk store.
+ARCHIVE_SUFFIXES = (".tar.zst", ".tar", ".chunks.json", ".tar.gz")
+
+# zstd gains next to nothing on these, so mostly-wheel caches are stored.
+_COMPRESSED_EXTS = {".whl", ".zip", ".gz", ".tgz", ".zst", ".xz", ".bz2", ".7z"}
+_STORE_THRESHOLD = 0.9
+
+_PART_SIZE = 64 * 1024 * 1024
+
+
+def object_key(key: str, suffix: str = ".tar.zst") -> str:
+    return f"{key}{suffix}"
+
+
+def archive_suffix(obj_key: str) -> str | None:
+    """The archive suffix of an object key, or None if it isn't an archive."""
+    for suffix in (".tar.zst", ".tar.gz", ".chunks.json", ".tar"):
+        if obj_key.endswith(suffix):
+            return suffix
+    return None
+
+
+def _is_missing(e) -> bool:
+    return e.response.get("Error", {}).get("Code", "") in ("404", "NoSuchKey", "NotFound")
 
 
 def head_exists(s3, bucket: str, key: str) -> bool:
@@ -47,90 +128,518 @@ def head_exists(s3, bucket: str, key: str) -> bool:
         s3.head_object(Bucket=bucket, Key=key)
         return True
     except ClientError as e:
-        if e.response.get("Error", {}).get("Code", "") in ("404", "NoSuchKey", "NotFound"):
+        if _is_missing(e):
             return False
         raise
 
 
+def find_exact(s3, bucket: str, key: str) -> str | None:
+    """Return the object key stored for exactly `key`, in any archive format."""
+    for suffix in ARCHIVE_SUFFIXES:
+        if head_exists(s3, bucket, object_key(key, suffix)):
+            return object_key(key, suffix)
+    return None
+
+
 def find_best_match(s3, bucket: str, prefix: str) -> str | None:
-    """Return the most-recently-modified object whose key starts with prefix."""
+    """Return the most-recently-modified archive whose key starts with prefix."""
     paginator = s3.get_paginator("list_objects_v2")
     best_key = None
     best_modified = None
     for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
         for obj in page.get("Contents", []) or []:
+            if archive_suffix(obj["Key"]) is None:
+                continue
             if best_modified is None or obj["LastModified"] > best_modified:
                 best_modified = obj["LastModified"]
                 best_key = obj["Key"]
     return best_key
 
 
-def download_and_extract(s3, bucket: str, key: str, path: Path) -> None:
+def index_key(index_prefix: str) -> str:
+    return f"{INDEX_PREFIX}{index_prefix}.json"
+
+
+def load_index(s3, bucket: str, index_prefix: str) -> tuple[dict | None, str | None]:
+    """Return (entries, etag) for an index, or (None, None) if it doesn't exist.
+    entries maps cache key -> {object, size, mtime, tier}."""
+    from botocore.exceptions import ClientError
+    try:
+        resp = s3.get_object(Bucket=bucket, Key=index_key(index_prefix))
+    except ClientError as e:
+        if _is_missing(e):
+            return None, None
+        raise
+    data = json.loads(resp["Body"].read())
+    return data.get("entries", {}), resp["ETag"]
+
+
+def best_index_match(entries: dict, prefix: str) -> str | None:
+    """Return the newest indexed cache key starting with prefix."""
+    matches = [k for k in entries if k.startswith(prefix)]
+    return max(matches, key=lambda k: entries[k]["mtime"], default=None)
+
+
+def update_index(s3, bucket: str, index_prefix: str, key: str, obj_key: str,
+                 size: int, *, keep_per_tier: int = 20, max_attempts: int = 5) -> None:
+    """Add key to the index with a compare-and-swap write, retrying when a
+    concurrent save got there first. Only the newest keep_per_tier keys of
+    each tier are kept, so the index stays small however old the bucket."""
+    from botocore.exceptions import ClientError, ParamValidationError
+    rest = key.removeprefix(index_prefix)
+    entry = {
+        "object": obj_key,
+        "size": size,
+        "mtime": datetime.datetime.now(datetime.timezone.utc)
+        .isoformat(timespec="seconds")
+        .replace("+00:00", "Z"),
+        "tier": rest.rsplit("-", 1)[0] if "-" in rest else "",
+    }
+    for attempt in range(max_attempts):
+        entries, etag = load_index(s3, bucket, index_prefix)
+        entries = dict(entries or {})
+        entries[key] = entry
+        by_tier: dict[str, list[str]] = {}
+        for k, v in entries.items():
+            by_tier.setdefault(v.get("tier", ""), []).append(k)
+        for keys in by_tier.values():
+            keys.sort(key=lambda k: entries[k]["mtime"], reverse=True)
+            for stale in keys[keep_per_tier:]:
+                del entries[stale]
+
+        extra = {
+            "Bucket": bucket,
+            "Key": index_key(index_prefix),
+            "Body": json.dumps({"schema_version": 1, "entries": entries},
+                               indent=1, sort_keys=True).encode(),
+            "ContentType": "application/json",
+        }
+        if etag:
+            extra["IfMatch"] = etag
+        else:
+            extra["IfNoneMatch"] = "*"
+        try:
+            s3.put_object(**extra)
+            return
+        except ParamValidationError:
+            # botocore predates conditional PutObject; a lost race only drops
+            # one index entry, which the next save of that tier re-adds.
+            print("::warning::botocore too old for conditional PutObject; "
+                  "updating cache index without compare-and-swap")
+            extra.pop("IfMatch", None)
+            extra.pop("IfNoneMatch", None)
+            s3.put_object(**extra)
+            return
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code", "")
+            if code in ("PreconditionFailed", "412", "ConditionalRequestConflict", "409") \
+                    and attempt < max_attempts - 1:
+                continue
+            if code in ("NotImplemented", "501"):
+                print("::warning::endpoint does not implement conditional PutObject; "
+                      "updating cache index without compare-and-swap")
+                extra.pop("IfMatch", None)
+                extra.pop("IfNoneMatch", None)
+                s3.put_object(**extra)
+                return
+            raise
+    print(f"::warning::Failed to update {index_key(index_prefix)} after retries")
+
+
+def _transfer_config():
+    from boto3.s3.transfer import TransferConfig
+    # upload_fileobj buffers max_concurrency parts of this size when reading
+    # a non-seekable stream, which bounds the memory used by a save.
+    return TransferConfig(multipart_chunksize=_PART_SIZE, max_concurrency=4)
+
+
+def _extract_chunked(s3, bucket: str, key: str, path: Path, chunk_cache: Path | None) -> None:
+    with chunkstore.open_chunked(s3, bucket, key, chunk_cache) as stream, \
+            tarfile.open(fileobj=stream, mode="r|", bufsize=1 << 20) as tf:
+        tf.extractall(str(path))
+        reader = stream.raw
+    print(f"Extracted {key} into {path}: {reader.downloaded:,} bytes downloaded, "
+          f"{reader.cached} chunk(s) from the local chunk cache")
+
+
+def download_and_extract(s3, bucket: str, key: str, path: Path,
+                         chunk_cache: Path | None = None) -> bool:
+    """Stream `key` from S3 through the decompressor into tarfile, so bytes
+    are extracted as they arrive and no archive copy ever touches disk.
+    Returns False if the object is gone (e.g. a stale index entry)."""
+    from botocore.exceptions import ClientError
     path.mkdir(parents=True, exist_ok=True)
-    with tempfile.NamedTemporaryFile(suffix=".tar.gz", delete=False) as tmp:
-        tmp_path = tmp.name
+    suffix = archive_suffix(key)
+    try:
+        if suffix == chunkstore.RECIPE_SUFFIX:
+            _extract_chunked(s3, bucket, key, path, chunk_cache)
+            return True
+        resp = s3.get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if _is_missing(e):
+            print(f"::warning::{key} is indexed but no longer exists")
+            return False
+        raise
+    body = resp["Body"]
+    print(f"Downloading {key} ({resp['ContentLength']:,} bytes)")
     try:
-        s3.download_file(bucket, key, tmp_path)
-        size = os.path.getsize(tmp_path)
-        print(f"Downloaded {key} ({size:,} bytes)")
-        with tarfile.open(tmp_path, "r:gz") as tf:
-            tf.extractall(str(path))
-        print(f"Extracted into {path}")
+        if suffix == ".tar.zst":
+            import zstandard
+            with zstandard.ZstdDecompressor().stream_reader(body) as reader, \
+                    tarfile.open(fileobj=reader, mode="r|", bufsize=1 << 20) as tf:
+                tf.extractall(str(path))
+        else:
+            mode = "r|gz" if suffix == ".tar.gz" else "r|"
+            with tarfile.open(fileobj=body, mode=mode, bufsize=1 << 20) as tf:
+                tf.extractall(str(path))
     finally:
-        try:
-            os.unlink(tmp_path)
-        except OSError:
-            pass
+        body.close()
+    print(f"Extracted into {path}")
+    return True
+
+
+def choose_compression(path: Path, compression: str) -> str:
+    """Resolve --compression auto: "none" when at least 90% of the bytes are
+    already-compressed files (the usual all-wheels cache), else "zstd"."""
+    if compression != "auto":
+        return compression
+    total = packed = 0
+    for f in path.rglob("*"):
+        if f.is_file() and not f.is_symlink():
+            size = f.stat().st_size
+            total += size
+            if f.suffix.lower() in _COMPRESSED_EXTS:
+                packed += size
+    return "none" if total and packed >= _STORE_THRESHOLD * total else "zstd"
+
+
+def _write_tar(path: Path, compression: str):
+    """Return a function writing `path` as a tar stream (through
+    multithreaded zstd for compression="zstd") to a file object."""
+    def write(pipe):
+        if compression == "zstd":
+            import zstandard
+            cctx = zstandard.ZstdCompressor(level=3, threads=-1)
+            with cctx.stream_writer(pipe, closefd=False) as zw, \
+                    tarfile.open(fileobj=zw, mode="w|", bufsize=1 << 20) as tf:
+                tf.add(str(path), arcname=".")
+        else:
+            with tarfile.open(fileobj=pipe, mode="w|", bufsize=1 << 20) as tf:
+                tf.add(str(path), arcname=".")
+    return write
+
+
+def compress_and_upload(s3, bucket: str, key: str, path: Path, compression: str = "zstd") -> int:
+    """Stream tar (optionally through multithreaded zstd) from a producer
+    thread into a multipart upload, without a temp file. Returns the size of
+    the uploaded object."""
+    content_type = "application/zstd" if compression == "zstd" else "application/x-tar"
+    try:
+        with chunkstore.producer_pipe(_write_tar(path, compression)) as pipe:
+            s3.upload_fileobj(pipe, bucket, key, ExtraArgs={"ContentType": content_type},
+                              Config=_transfer_config())
+    except BaseException:
+        # The pipe may have closed early, leaving a truncated archive behind.
+        s3.delete_object(Bucket=bucket, Key=key)
+        raise
+    size = s3.head_object(Bucket=bucket, Key=key)["ContentLength"]
+    print(f"Uploaded {key} ({size:,} bytes, {compression})")
+    return size
 
 
-def compress_and_upload(s3, bucket: str, key: str, path: Path) -> None:
-    if not path.exists():
-        print(f"::warning::cache path {path} does not exist, nothing to save")
-        return
-    with tempfile.NamedTemporaryFile(suffix=".tar.gz", delete=False) as tmp:
-        tmp_path = tmp.name
+def upload_chunked(s3, bucket: str, key: str, path: Path) -> int:
+    """Store `path` as a tar in the chunk store, uploading only new chunks.
+    The recipe is written last, and only after the tar writer finished
+    cleanly, so a failed save leaves no archive behind. Returns the size of
+    the tar."""
     try:
-        with tarfile.open(tmp_path, "w:gz", compresslevel=3) as tf:
-            tf.add(str(path), arcname=".")
-        size = os.path.getsize(tmp_path)
-        print(f"Packed {path} -> {tmp_path} ({size:,} bytes)")
-        s3.upload_file(
-            tmp_path,
-            bucket,
-            key,
-            ExtraArgs={"ContentType": "application/gzip"},
-        )
-        print(f"Uploaded {key}")
-    finally:
+        with chunkstore.producer_pipe(_write_tar(path, "none")) as pipe:
+            stats = chunkstore.upload_chunked(s3, bucket, pipe, key)
+    except BaseException:
+        # Belt and braces: never leave a recipe for a truncated tar, which
+        # find_exact would report as present forever.
+        s3.delete_object(Bucket=bucket, Key=key)
+        raise
+    print(f"Uploaded {key}: {stats['new_chunks']} of {stats['chunks']} chunk(s) new, "
+          f"{stats['uploaded']:,} of {stats['size']:,} bytes sent")
+    return stats["size"]
+
+
+def _sha256_of(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def fetch_entry(s3, bucket: str, cache_key: str, cache_dir: Path) -> bool:
+    """Download one per-entry marker and those of its wheels not already in
+    cache_dir/objects/. Returns False if the bucket has no such entry or a
+    downloaded wheel fails its sha256 check; the local marker is only
+    written once every wheel is in place."""
+    from botocore.exceptions import ClientError
+    try:
+        resp = s3.get_object(Bucket=bucket, Key=f"{MARKER_PREFIX}{cache_key}.marker")
+    except ClientError as e:
+        if _is_missing(e):
+            return False
+        raise
+    body = resp["Body"].read()
+    entries: dict[str, str] = json.loads(body)
+    objects_dir = cache_dir / "objects"
+    objects_dir.mkdir(parents=True, exist_ok=True)
+    for sha in sorted(set(entries.values())):
+        dest = objects_dir / f"{sha}.whl"
+        if dest.exists():
+            continue
+        # Unique per thread: --jobs builds may fetch the same object at once.
+        tmp = objects_dir / f".{sha}.{os.getpid()}.{threading.get_ident()}.part"
         try:
-            os.unlink(tmp_path)
-        except OSError:
-            pass
+            s3.download_file(bucket, f"{OBJECT_PREFIX}{sha}.whl", str(tmp))
+        except ClientError as e:
+            if _is_missing(e):  # evicted by gc after the marker was read
+                tmp.unlink(missing_ok=True)
+                return False
+            raise
+        if _sha256_of(tmp) != sha:
+            tmp.unlink()
+            print(f"::warning::{OBJECT_PREFIX}{sha}.whl failed its sha256 check")
+            return False
+        os.replace(tmp, dest)
+    (cache_dir / f"{cache_key}.marker").write_bytes(body)
+
+    meta_key = f"{MARKER_PREFIX}{cache_key}.meta"
+    try:
+        meta = json.loads(s3.get_object(Bucket=bucket, Key=meta_key)["Body"].read())
+    except ClientError as e:
+        if not _is_missing(e):
+            raise
+        meta = {}
+    now = time.time()
+    if now - meta.get("atime", 0) > _TOUCH_INTERVAL:
+        meta["atime"] = now
+        s3.put_object(Bucket=bucket, Key=meta_key, Body=json.dumps(meta).encode(),
+                      ContentType="application/json")
+    (cache_dir / f"{cache_key}.meta").write_text(json.dumps(meta))
+    return True
+
+
+def push_entry(s3, bucket: str, cache_key: str, cache_dir: Path) -> int:
+    """Upload one local marker plus the wheels the bucket doesn't have yet.
+    The marker goes last so its presence means the entry is complete.
+    Returns the number of wheel bytes uploaded."""
+    entries = json.loads((cache_dir / f"{cache_key}.marker").read_text())
+    if not isinstance(entries, dict):
+        return 0  # legacy flat-list marker; only the tarball mode carries those
+    uploaded = 0
+    for sha in sorted(set(entries.values())):
+        key = f"{OBJECT_PREFIX}{sha}.whl"
+        if head_exists(s3, bucket, key):
+            continue
+        path = cache_dir / "objects" / f"{sha}.whl"
+        s3.upload_file(str(path), bucket, key,
+                       ExtraArgs={"ContentType": "application/octet-stream"})
+        uploaded += path.stat().st_size
+    meta = cache_dir / f"{cache_key}.meta"
+    if meta.exists():
+        s3.put_object(Bucket=bucket, Key=f"{MARKER_PREFIX}{cache_key}.meta",
+                      Body=meta.read_bytes(), ContentType="application/json")
+    s3.put_object(Bucket=bucket, Key=f"{MARKER_PREFIX}{cache_key}.marker",
+                  Body=json.dumps(entries, sort_keys=True).encode(),
+                  ContentType="application/json")
+    return uploaded
+
+
+def parse_size(text: str) -> int:
+    """Parse a byte count such as "750M" or "20G" (binary units)."""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    text = text.strip().upper().removesuffix("B").removesuffix("I")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def _eviction_score(entry: dict, now: float) -> float:
+    return (now - entry["atime"]) / (entry["cost"] + _COST_FLOOR)
+
+
+def plan_eviction(entries: dict[str, dict], object_sizes: dict[str, int],
+                  budget: int, orphans: list[str]) -> tuple[list[str], list[str], int]:
+    """Pick entries to evict until the cache fits in budget.
+
+    entries maps cache key -> {objects, atime, cost, size}, where size
+    counts only the marker and meta files and objects names the wheels the
+    marker references. object_sizes maps every stored wheel to its size;
+    `orphans` are unreferenced ones that may go straight away. Returns the
+    (evicted keys, objects to delete, remaining bytes)."""
+    refs = Counter(obj for e in entries.values() for obj in e["objects"])
+    total = sum(object_sizes.values()) + sum(e["size"] for e in entries.values())
+    freed = []
+    for obj in orphans:
+        total -= object_sizes[obj]
+        freed.append(obj)
+    now = time.time()
+    evicted = []
+    for key in sorted(entries, key=lambda k: _eviction_score(entries[k], now), reverse=True):
+        if total <= budget:
+            break
+        entry = entries[key]
+        evicted.append(key)
+        total -= entry["size"]
+        for obj in entry["objects"]:
+            refs[obj] -= 1
+            if refs[obj] == 0 and obj in object_sizes:
+                total -= object_sizes[obj]
+                freed.append(obj)
+    return evicted, freed, total
+
+
+def _read_json(path: Path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def gc_local(path: Path, budget: int, dry_run: bool) -> None:
+    entries: dict[str, dict] = {}
+    for marker in path.glob("*.marker"):
+        key = marker.name.removesuffix(".marker")
+        data = _read_json(marker)
+        if data is None:
+            continue
+        if isinstance(data, dict):
+            objects = {f"objects/{sha}.whl" for sha in data.values()}
+        else:
+            objects = set(data)  # legacy flat-list marker
+        meta_path = path / f"{key}.meta"
+        meta = _read_json(meta_path) or {}
+        entries[key] = {
+            "objects": objects,
+            "atime": meta.get("atime", marker.stat().st_mtime),
+            "cost": meta.get("cost", 0.0),
+            "size": marker.stat().st_size + (meta_path.stat().st_size if meta_path.exists() else 0),
+        }
+    object_sizes = {f"objects/{f.name}": f.stat().st_size
+                    for f in (path / "objects").glob("*.whl")}
+    object_sizes.update({f.name: f.stat().st_size for f in path.glob("*.whl")})
+    referenced = {obj for e in entries.values() for obj in e["objects"]}
+    orphans = [obj for obj in object_sizes if obj not in referenced]
+
+    evicted, freed, total = plan_eviction(entries, object_sizes, budget, orphans)
+    print(f"Local cache {path}: evicting {len(evicted)} of {len(entries)} entr(y/ies) "
+          f"and {len(freed)} wheel(s); {total:,} bytes remain (budget {budget:,})")
+    if dry_run:
+        return
+    for key in evicted:
+        (path / f"{key}.marker").unlink(missing_ok=True)
+        (path / f"{key}.meta").unlink(missing_ok=True)
+    for obj in freed:
+        (path / obj).unlink(missing_ok=True)
+
+
+def _delete_keys(s3, bucket: str, keys: list[str]) -> None:
+    for i in range(0, len(keys), 1000):
+        s3.delete_objects(Bucket=bucket, Delete={
+            "Objects": [{"Key": k} for k in keys[i:i + 1000]], "Quiet": True})
+
+
+def gc_remote(s3, bucket: str, budget: int, dry_run: bool) -> None:
+    import concurrent.futures
+    paginator = s3.get_paginator("list_objects_v2")
+    listing: dict[str, dict] = {}
+    for prefix in (MARKER_PREFIX, OBJECT_PREFIX):
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get("Contents", []) or []:
+                listing[obj["Key"]] = obj
+
+    def load(key: str):
+        return key, json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+
+    sidecars = [k for k in listing
+                if k.startswith(MARKER_PREFIX) and k.endswith((".marker", ".meta"))]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as pool:
+        docs = dict(pool.map(load, sidecars))
+
+    entries: dict[str, dict] = {}
+    for key, data in docs.items():
+        if not key.endswith(".marker"):
+            continue
+        cache_key = key[len(MARKER_PREFIX):].removesuffix(".marker")
+        meta_key = f"{MARKER_PREFIX}{cache_key}.meta"
+        meta = docs.get(meta_key, {})
+        entries[cache_key] = {
+            "objects": {f"{OBJECT_PREFIX}{sha}.whl" for sha in data.values()},
+            "atime": meta.get("atime", listing[key]["LastModified"].timestamp()),
+            "cost": meta.get("cost", 0.0),
+            "size": listing[key]["Size"] + (listing[meta_key]["Size"] if meta_key in listing else 0),
+        }
+    object_sizes = {k: o["Size"] for k, o in listing.items() if k.startswith(OBJECT_PREFIX)}
+    referenced = {obj for e in entries.values() for obj in e["objects"]}
+    now = time.time()
+    orphans = [k for k in object_sizes if k not in referenced
+               and now - listing[k]["LastModified"].timestamp() > _ORPHAN_GRACE]
+
+    evicted, freed, total = plan_eviction(entries, object_sizes, budget, orphans)
+    print(f"S3 per-entry cache: evicting {len(evicted)} of {len(entries)} entr(y/ies) "
+          f"and {len(freed)} wheel(s); {total:,} bytes remain (budget {budget:,})")
+    if dry_run:
+        return
+    # Markers first, so no surviving marker ever points at a deleted wheel.
+    _delete_keys(s3, bucket, [f"{MARKER_PREFIX}{k}{suffix}"
+                              for k in evicted for suffix in (".marker", ".meta")])
+    _delete_keys(s3, bucket, freed)
+
+
+def cmd_gc(args) -> int:
+    if not args.path and not args.remote:
+        print("::error::gc needs --path and/or --remote")
+        return 2
+    budget = parse_size(args.budget)
+    if args.path:
+        gc_local(Path(args.path), budget, args.dry_run)
+    if args.remote:
+        gc_remote(s3_client(), os.environ["S3_CACHE_BUCKET"], budget, args.dry_run)
+    return 0
 
 
 def cmd_restore(args) -> int:
     bucket = os.environ["S3_CACHE_BUCKET"]
     s3 = s3_client()
 
-    exact_key = object_key(args.key)
-    if head_exists(s3, bucket, exact_key):
+    # By convention the shortest restore-key is the family every key of this
+    # cache shares, so it names the index when none is given.
+    index_prefix = args.index_prefix or min(args.restore_keys or [""], key=len)
+    entries = None
+    if index_prefix:
+        entries, _ = load_index(s3, bucket, index_prefix)
+        if entries is None:
+            print(f"No cache index {index_key(index_prefix)}; falling back to listing")
+
+    exact_key = entries[args.key]["object"] if entries and args.key in entries else None
+    exact_key = exact_key or find_exact(s3, bucket, args.key)
+    if exact_key and download_and_extract(s3, bucket, exact_key, Path(args.path),
+                                          args.chunk_cache):
         print(f"Cache HIT (exact): {exact_key}")
-        download_and_extract(s3, bucket, exact_key, Path(args.path))
         _set_output("cache-hit", "true")
         _set_output("matched-key", args.key)
         return 0
 
-    print(f"Cache MISS (exact): {exact_key}")
-    suffix = ".tar.gz"
+    print(f"Cache MISS (exact): {args.key}")
     for rk in args.restore_keys or []:
         # restore-key is itself a prefix of valid keys; find any object whose
-        # key starts with `<rk>` and ends with the archive suffix.
-        matched = find_best_match(s3, bucket, rk)
-        if matched and matched.endswith(suffix):
+        # key starts with `<rk>` and ends with an archive suffix.
+        if entries is not None:
+            best = best_index_match(entries, rk)
+            matched = entries[best]["object"] if best else None
+        else:
+            matched = find_best_match(s3, bucket, rk)
+        if matched and download_and_extract(s3, bucket, matched, Path(args.path),
+                                            args.chunk_cache):
             print(f"Cache HIT (restore-key '{rk}' -> '{matched}')")
-            download_and_extract(s3, bucket, matched, Path(args.path))
             _set_output("cache-hit", "false")
-            _set_output("matched-key", matched.removesuffix(suffix))
+            _set_output("matched-key", matched.removesuffix(archive_suffix(matched)))
             return 0
         print(f"Cache MISS (restore-key '{rk}')")
 
@@ -143,12 +652,49 @@ def cmd_save(args) -> int:
     bucket = os.environ["S3_CACHE_BUCKET"]
     s3 = s3_client()
 
-    exact_key = object_key(args.key)
-    if head_exists(s3, bucket, exact_key):
-        print(f"Cache already present, skipping save: {exact_key}")
+    existing = find_exact(s3, bucket, args.key)
+    if existing:
+        print(f"Cache already present, skipping save: {existing}")
+        if args.index_prefix:
+            entries, _ = load_index(s3, bucket, args.index_prefix)
+            if not entries or args.key not in entries:
+                size = s3.head_object(Bucket=bucket, Key=existing)["ContentLength"]
+                update_index(s3, bucket, args.index_prefix, args.key, existing, size)
+        return 0
+
+    path = Path(args.path)
+    if not path.exists():
+        print(f"::warning::cache path {path} does not exist, nothing to save")
         return 0
+    if args.chunked:
+        obj_key = object_key(args.key, chunkstore.RECIPE_SUFFIX)
+        size = upload_chunked(s3, bucket, obj_key, path)
+    else:
+        compression = choose_compression(path, args.compression)
+        suffix = ".tar.zst" if compression == "zstd" else ".tar"
+        obj_key = object_key(args.key, suffix)
+        size = compress_and_upload(s3, bucket, obj_key, path, compression)
+    if args.index_prefix:
+        update_index(s3, bucket, args.index_prefix, args.key, obj_key, size)
+        print(f"Indexed {args.key} in {index_key(args.index_prefix)}")
+    return 0
+
+
+def cmd_save_entries(args) -> int:
+    bucket = os.environ["S3_CACHE_BUCKET"]
+    s3 = s3_client()
 
-    compress_and_upload(s3, bucket, exact_key, Path(args.path))
+    path = Path(args.path)
+    pushed = skipped = uploaded = 0
+    for marker in sorted(path.glob("*.marker")):
+        cache_key = marker.name.removesuffix(".marker")
+        if head_exists(s3, bucket, f"{MARKER_PREFIX}{cache_key}.marker"):
+            skipped += 1
+            continue
+        uploaded += push_entry(s3, bucket, cache_key, path)
+        pushed += 1
+    print(f"Pushed {pushed} new entr(y/ies) ({uploaded:,} wheel bytes), "
+          f"{skipped} already present")
     return 0
 
 
@@ -168,16 +714,42 @@ def main() -> int:
     r.add_argument("--path", required=True)
     r.add_argument("--key", required=True)
     r.add_argument("--restore-keys", nargs="*", default=[])
+    r.add_argument("--index-prefix", default="",
+                   help="Cache index to resolve keys with (default: shortest restore-key).")
+    r.add_argument("--chunk-cache", type=Path,
+                   default=Path(tempfile.gettempdir()) / "mpy-chunk-cache",
+                   help="Local cache of chunk-store chunks, reused across restores.")
 
     s = sub.add_parser("save")
     s.add_argument("--path", required=True)
     s.add_argument("--key", required=True)
+    s.add_argument("--compression", choices=("auto", "zstd", "none"), default="auto",
+                   help="zstd, uncompressed tar, or pick by content (default).")
+    s.add_argument("--index-prefix", default="",
+                   help="Record the key in the cache index for this prefix.")
+    s.add_argument("--chunked", action="store_true",
+                   help="Store the archive in the deduplicating chunk store.")
+
+    se = sub.add_parser("save-entries")
+    se.add_argument("--path", required=True)
+
+    g = sub.add_parser("gc")
+    g.add_argument("--budget", required=True,
+                   help="Size to shrink the cache to, e.g. 20G.")
+    g.add_argument("--path", help="Local wheel cache directory to prune.")
+    g.add_argument("--remote", action="store_true",
+                   help="Prune the per-entry store in the S3 cache bucket.")
+    g.add_argument("--dry-run", action="store_true")
 
     args = parser.parse_args()
     if args.cmd == "restore":
         return cmd_restore(args)
     if args.cmd == "save":
         return cmd_save(args)
+    if args.cmd == "save-entries":
+        return cmd_save_entries(args)
+    if args.cmd == "gc":
+        return cmd_gc(args)
     return 2
 
 
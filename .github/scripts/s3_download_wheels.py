@@ -1,23 +1,50 @@
 #!/usr/bin/env python3
 """Download all built wheels for a run from S3 into a local directory.
 
-Each build job uploads its built_wheels/ to:
-    s3://<bucket>/run-wheels/<run_id>/<arch>/<tier-or-split>.tar.zst
+Each build job uploads its built_wheels/ as a snapshot under:
+    s3://<bucket>/wheel-snapshots/<run_id>/<arch>/<tier-or-split>.*
 
-This script lists all objects under that prefix, downloads each archive,
-and extracts every .whl into the output directory.  Duplicate wheel
-filenames (same package built in different tiers) are harmless — the
-last one extracted wins.
+This script lists all snapshots under that prefix. Manifest snapshots
+(`.manifest.json`, see s3_upload_wheels.py) are merged first, and every
+unique wheel is fetched once from wheel-snapshots/objects/<sha256>.whl,
+however many tiers carried it. Archive snapshots (`.tar.zst`) are
+extracted whole; there duplicate wheel filenames (same package built in
+different tiers) are harmless — whichever is written last wins.
+
+All downloads run concurrently on a bounded pool (--jobs), archives are
+decompressed straight from the streaming response body, and a wheel whose
+name and sha256 already exist in the output directory is not rewritten.
+
+Snapshots uploaded with --chunked (`<name>.chunks.json`) are reassembled
+from the chunk store; chunks are kept in --chunk-cache for later runs.
+
+With --plan only the wheels final_test.py will install are fetched: the
+top-level packages/<tag>-<platform> entries plus their transitive closure
+over the runtime edges of build_and_test's dependency graph and the
+Requires-Dist recorded in the manifests, including the requirements of
+every extra that something in the closure asks for (`foo[bar]`). Wheels
+only needed to build something are left in the bucket. Names in the closure
+that no manifest has a wheel for are reported, since pip will go to PyPI
+for them. Archive snapshots have no per-wheel index and are still
+extracted whole.
 """
 
 import argparse
-import io
+import concurrent.futures
+import hashlib
+import json
 import os
+import platform
+import re
 import sys
 import tarfile
+import tempfile
+import threading
 import zstandard
 from pathlib import Path
 
+import chunkstore
+
 
 def s3_client():
     import boto3
@@ -36,13 +63,205 @@ def s3_client():
     )
 
 
+def sha256_of(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class OutputDir:
+    """The output directory plus the sha256 of each wheel in it, so a wheel
+    that another snapshot (or an earlier run) already wrote with the same
+    name and hash is skipped rather than rewritten."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._hashes: dict[str, str] = {}
+
+    def has(self, name: str, sha: str) -> bool:
+        with self._lock:
+            known = self._hashes.get(name)
+        if known is None:
+            dest = self.path / name
+            if not dest.exists():
+                return False
+            known = sha256_of(dest)
+            with self._lock:
+                self._hashes[name] = known
+        return known == sha
+
+    def temp_path(self, name: str) -> Path:
+        return self.path / f".{name}.{threading.get_ident()}.part"
+
+    def commit(self, tmp: Path, name: str, sha: str) -> None:
+        os.replace(tmp, self.path / name)
+        with self._lock:
+            self._hashes[name] = sha
+
+
+def extract_wheels(stream, out: OutputDir) -> tuple[int, int]:
+    """Extract the .whl members of a tar stream as they arrive. Returns
+    (extracted, skipped as already present)."""
+    extracted = skipped = 0
+    with tarfile.open(fileobj=stream, mode="r|", bufsize=1 << 20) as tf:
+        for member in tf:
+            if not member.name.endswith(".whl"):
+                continue
+            fobj = tf.extractfile(member)
+            if fobj is None:
+                continue
+            name = Path(member.name).name
+            tmp = out.temp_path(name)
+            h = hashlib.sha256()
+            with open(tmp, "wb") as f:
+                for block in iter(lambda: fobj.read(1 << 20), b""):
+                    h.update(block)
+                    f.write(block)
+            sha = h.hexdigest()
+            if out.has(name, sha):
+                tmp.unlink()
+                skipped += 1
+                continue
+            out.commit(tmp, name, sha)
+            extracted += 1
+            print(f"    extracted {name} ({member.size} bytes)")
+    return extracted, skipped
+
+
+def download_archive(s3, bucket: str, key: str, out: OutputDir,
+                     chunk_cache: Path) -> tuple[int, int]:
+    """Decompress and extract one archive snapshot straight from the
+    streaming response body; nothing is buffered whole."""
+    name = key.rsplit("/", 1)[-1]
+    if key.endswith(chunkstore.RECIPE_SUFFIX):
+        with chunkstore.open_chunked(s3, bucket, key, chunk_cache) as stream:
+            counts = extract_wheels(stream, out)
+            print(f"  {name}: {stream.raw.downloaded} bytes downloaded, "
+                  f"{stream.raw.cached} chunk(s) from the local chunk cache")
+        return counts
+
+    resp = s3.get_object(Bucket=bucket, Key=key)
+    print(f"  {name}: streaming {resp['ContentLength']} bytes")
+    body = resp["Body"]
+    try:
+        with zstandard.ZstdDecompressor().stream_reader(body) as reader:
+            return extract_wheels(reader, out)
+    finally:
+        body.close()
+
+
+def merge_manifests(s3, bucket: str, keys: list[str], jobs: int) -> dict[str, dict]:
+    """Union of {filename: {sha256, size, object}} over manifest snapshots.
+    A filename listed with different hashes keeps the first, with a warning."""
+    def load(key: str) -> dict:
+        return json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        manifests = list(pool.map(load, keys))
+    wheels: dict[str, dict] = {}
+    for key, manifest in zip(keys, manifests):
+        prefix = manifest.get("object_prefix", "wheel-snapshots/objects/")
+        for name, entry in manifest["wheels"].items():
+            entry = dict(entry, object=f"{prefix}{entry['sha256']}.whl")
+            seen = wheels.setdefault(name, entry)
+            if seen["sha256"] != entry["sha256"]:
+                print(f"::warning::{name} differs between snapshots; keeping the "
+                      f"first ({seen['sha256'][:12]}), ignoring {key}")
+    return wheels
+
+
+def _wheel_name(filename: str, entry: dict) -> str:
+    return entry.get("name") or re.sub(r"[-_.]+", "-", filename.split("-", 1)[0]).lower()
+
+
+def plan_wheels(wheels: dict[str, dict], root: Path, monolithpy_tag: str) -> dict[str, dict]:
+    """Narrow merged manifest wheels to the install closure of the top-level
+    packages for this platform (see --plan)."""
+    from build_and_test import build_catalog, build_dep_graph, normalize_pkg_name
+
+    suffix = f"{monolithpy_tag}-{'windows' if platform.system() == 'Windows' else 'macos'}"
+    packages_dir = root / "packages" / suffix
+    catalog = build_catalog(packages_dir, root / "dependencies" / suffix,
+                            root / "build_tools" / suffix)
+    graph = {normalize_pkg_name(name): {normalize_pkg_name(d) for d in deps}
+             for name, deps in build_dep_graph(catalog, runtime_only=True).items()}
+
+    by_name: dict[str, list[str]] = {}
+    for filename, entry in wheels.items():
+        by_name.setdefault(_wheel_name(filename, entry), []).append(filename)
+
+    todo = [normalize_pkg_name(d.name) for d in packages_dir.iterdir() if d.is_dir()]
+    needed: set[str] = set()
+    seen: set[str] = set()  # requirement strings, extras included
+    no_metadata: set[str] = set()
+    while todo:
+        req = todo.pop()
+        if req in seen:
+            continue
+        seen.add(req)
+        name, _, extras = req.partition("[")
+        extras = [e for e in extras.rstrip("]").split(",") if e]
+        if name not in needed:
+            needed.add(name)
+            todo.extend(graph.get(name, ()))
+        for filename in by_name.get(name, ()):
+            entry = wheels[filename]
+            if "requires" not in entry:
+                no_metadata.add(filename)
+            if not extras:
+                todo.extend(entry.get("requires", ()))
+            for extra in extras:
+                todo.extend(entry.get("extras", {}).get(extra, ()))
+
+    unresolved = sorted(needed - set(by_name))
+    if unresolved:
+        print(f"::notice::{len(unresolved)} name(s) in the install plan have no "
+              f"snapshot wheel; pip will resolve them from PyPI or an archive "
+              f"snapshot: {', '.join(unresolved)}")
+    if no_metadata:
+        print(f"::warning::{len(no_metadata)} wheel(s) in the plan have no recorded "
+              f"requirements (older manifest); their dependencies are followed only "
+              f"through the recipe graph: {', '.join(sorted(no_metadata))}")
+    return {f: e for f, e in wheels.items() if _wheel_name(f, e) in needed}
+
+
+def fetch_wheel(s3, bucket: str, name: str, entry: dict, out: OutputDir) -> tuple[int, int]:
+    """Fetch one manifest wheel unless it is already present. Returns
+    (fetched, skipped) like extract_wheels."""
+    if out.has(name, entry["sha256"]):
+        return 0, 1
+    tmp = out.temp_path(name)
+    s3.download_file(bucket, entry["object"], str(tmp))
+    if sha256_of(tmp) != entry["sha256"]:
+        tmp.unlink()
+        raise ValueError(f"{entry['object']} does not match its sha256")
+    out.commit(tmp, name, entry["sha256"])
+    print(f"    fetched {name} ({entry['size']} bytes)")
+    return 1, 0
+
+
 def main() -> int:
     parser = argparse.ArgumentParser()
     parser.add_argument("--run-id", required=True)
     parser.add_argument("--arch", required=True,
                         help="e.g. 'arm64' or 'x86_64'")
     parser.add_argument("--output", required=True, type=Path)
+    parser.add_argument("--chunk-cache", type=Path,
+                        default=Path(tempfile.gettempdir()) / "mpy-chunk-cache",
+                        help="Local cache of chunk-store chunks, reused across runs.")
+    parser.add_argument("--jobs", type=int, default=8,
+                        help="Concurrent downloads (default: 8).")
+    parser.add_argument("--plan", action="store_true",
+                        help="Fetch only the wheels final-test installs, resolved "
+                             "against the recipes in the current directory.")
+    parser.add_argument("--monolithpy-tag", default=os.environ.get("MONOLITHPY_TAG"),
+                        help="MonolithPy tag for --plan (default: $MONOLITHPY_TAG).")
     args = parser.parse_args()
+    if args.plan and not args.monolithpy_tag:
+        parser.error("--plan requires --monolithpy-tag or MONOLITHPY_TAG")
 
     bucket = os.environ["S3_CACHE_BUCKET"]
     prefix = f"wheel-snapshots/{args.run_id}/{args.arch}/"
@@ -62,30 +281,40 @@ def main() -> int:
 
     print(f"Found {len(keys)} snapshot(s)")
     args.output.mkdir(parents=True, exist_ok=True)
+    out = OutputDir(args.output)
+
+    manifests = [k for k in keys if k.endswith(".manifest.json")]
+    archives = [k for k in keys if not k.endswith(".manifest.json")]
+    wheels = merge_manifests(s3, bucket, manifests, args.jobs) if manifests else {}
+    if manifests:
+        print(f"  {len(manifests)} manifest snapshot(s) list {len(wheels)} unique wheel(s)")
+    if args.plan and wheels:
+        listed = len(wheels)
+        wheels = plan_wheels(wheels, Path.cwd(), args.monolithpy_tag)
+        print(f"  install plan needs {len(wheels)} of them; "
+              f"skipping {listed - len(wheels)} build-only wheel(s)")
 
-    for key in keys:
-        name = key.rsplit("/", 1)[-1]
-        print(f"  downloading {name} ...")
-        resp = s3.get_object(Bucket=bucket, Key=key)
-        body = resp["Body"].read()
-        print(f"    {len(body)} bytes")
-
-        dctx = zstandard.ZstdDecompressor()
-        with dctx.stream_reader(io.BytesIO(body)) as reader:
-            with tarfile.open(fileobj=reader, mode="r|") as tf:
-                for member in tf:
-                    if member.name.endswith(".whl"):
-                        dest = args.output / Path(member.name).name
-                        fobj = tf.extractfile(member)
-                        if fobj is None:
-                            continue
-                        with open(dest, "wb") as out:
-                            out.write(fobj.read())
-                        print(f"    extracted {dest.name} ({member.size} bytes)")
+    written = skipped = 0
+    failed = False
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(fetch_wheel, s3, bucket, name, entry, out): name
+                   for name, entry in sorted(wheels.items())}
+        futures.update({pool.submit(download_archive, s3, bucket, key, out,
+                                    args.chunk_cache): key for key in archives})
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                w, s = future.result()
+            except Exception as e:
+                print(f"::error::Downloading {futures[future]} failed: {e}", file=sys.stderr)
+                failed = True
+                continue
+            written += w
+            skipped += s
 
     whl_count = len(list(args.output.glob("*.whl")))
-    print(f"\nTotal: {whl_count} wheel(s) in {args.output}")
-    return 0
+    print(f"\nTotal: {whl_count} wheel(s) in {args.output} "
+          f"({written} written, {skipped} already present)")
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
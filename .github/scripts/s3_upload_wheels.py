@@ -1,19 +1,52 @@
 #!/usr/bin/env python3
-"""Upload built_wheels/ to S3 as a single tar.zst snapshot.
+"""Upload built_wheels/ to S3 as a run-scoped wheel snapshot.
 
 Used by each build job to push its wheel directory to a well-known
 run-scoped prefix so final-test can download from S3 instead of relying
 on GitHub's artifact system (which occasionally truncates large files).
+
+By default every wheel is stored once, content-addressed, and the snapshot
+itself is a small manifest:
+
+    wheel-snapshots/objects/<sha256>.whl
+    wheel-snapshots/<run_id>/<arch>/<name>.manifest.json   # {wheels: {file: {...}}}
+
+Each manifest entry holds the wheel's sha256 and size, plus its
+distribution name and its Requires-Dist, split into `requires` and
+per-extra `extras` lists of `name` or `name[extra,...]`, which
+s3_download_wheels.py --plan follows to fetch only what final-test installs.
+
+Each tier starts from the previous tier's built_wheels/, and Round 2 splits
+carry the Round 1 wheels, so most wheels of a snapshot are already in the
+bucket (from this run or an earlier one) and are skipped.
+
+With --tar the snapshot is a single `<name>.tar.zst` instead. The tar is
+streamed from a producer thread through multithreaded zstd into a multipart
+upload, so compression overlaps the network transfer and peak memory is a
+few upload parts regardless of how big the heavy tier's scipy, numpy and
+OpenBLAS wheels are.
+
+With --chunked the tar goes to the deduplicating chunk store instead
+(`<name>.chunks.json` plus shared `chunks/<sha256>`, see chunkstore.py), so
+wheels unchanged since an earlier snapshot are not uploaded again.
 """
 
 import argparse
-import io
+import concurrent.futures
+import hashlib
+import json
 import os
+import re
 import sys
 import tarfile
+import zipfile
 import zstandard
 from pathlib import Path
 
+import chunkstore
+
+OBJECT_PREFIX = "wheel-snapshots/objects/"
+
 
 def s3_client():
     import boto3
@@ -32,6 +65,119 @@ def s3_client():
     )
 
 
+def transfer_config():
+    from boto3.s3.transfer import TransferConfig
+    # Reading a non-seekable stream, upload_fileobj buffers at most
+    # max_concurrency parts of multipart_chunksize each.
+    return TransferConfig(multipart_chunksize=32 * 1024 * 1024, max_concurrency=4)
+
+
+def write_tar(whls: list[Path], fileobj, compress: bool) -> None:
+    """Write whls as a tar stream to fileobj, through zstd if compress."""
+    if compress:
+        cctx = zstandard.ZstdCompressor(level=3, threads=-1)
+        with cctx.stream_writer(fileobj, closefd=False) as zw:
+            write_tar(whls, zw, compress=False)
+        return
+    with tarfile.open(fileobj=fileobj, mode="w|", bufsize=1 << 20) as tf:
+        for whl in whls:
+            tf.add(whl, arcname=whl.name)
+
+
+def sha256_of(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _normalize(name: str) -> str:
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+_REQ_RE = re.compile(r"\s*([A-Za-z0-9][A-Za-z0-9._-]*)\s*(?:\[([^\]]*)\])?")
+_EXTRA_MARKER_RE = re.compile(r"""\bextra\s*==\s*['"]([^'"]+)['"]""")
+
+
+def _requirement(req: str) -> str:
+    """`name` or `name[extra,...]`, normalized, for one requirement string."""
+    m = _REQ_RE.match(req)
+    name = _normalize(m.group(1))
+    extras = sorted(_normalize(e) for e in (m.group(2) or "").split(",") if e.strip())
+    return f"{name}[{','.join(extras)}]" if extras else name
+
+
+def wheel_requirements(whl: Path) -> tuple[str, list[str], dict[str, list[str]]]:
+    """Return (normalized name, requirements, {extra: requirements}) from a
+    wheel's METADATA. Other environment markers are ignored, so a
+    requirement that only applies on some platforms is still listed."""
+    with zipfile.ZipFile(whl) as zf:
+        meta_name = next(n for n in zf.namelist()
+                         if n.count("/") == 1 and n.endswith(".dist-info/METADATA"))
+        metadata = zf.read(meta_name).decode("utf-8", "replace")
+    name = ""
+    requires: set[str] = set()
+    extras: dict[str, set[str]] = {}
+    for line in metadata.splitlines():
+        if not line.strip():
+            break  # headers end at the first blank line
+        key, _, value = line.partition(":")
+        if key == "Name":
+            name = _normalize(value.strip())
+        elif key == "Requires-Dist":
+            req, _, marker = value.partition(";")
+            extra = _EXTRA_MARKER_RE.search(marker)
+            target = extras.setdefault(_normalize(extra.group(1)), set()) if extra else requires
+            target.add(_requirement(req))
+    return name, sorted(requires), {e: sorted(r) for e, r in sorted(extras.items())}
+
+
+def exists(s3, bucket: str, key: str) -> bool:
+    from botocore.exceptions import ClientError
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code", "") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+
+def upload_wheel_objects(s3, bucket: str, whls: list[Path], manifest_key: str,
+                         jobs: int = 8) -> tuple[int, int]:
+    """Upload every wheel the bucket lacks as objects/<sha256>.whl, then the
+    manifest. Returns (wheels uploaded, bytes uploaded)."""
+    def put(whl: Path) -> tuple[str, dict, int]:
+        sha = sha256_of(whl)
+        key = f"{OBJECT_PREFIX}{sha}.whl"
+        entry = {"sha256": sha, "size": whl.stat().st_size}
+        try:
+            entry["name"], entry["requires"], entry["extras"] = wheel_requirements(whl)
+        except (zipfile.BadZipFile, StopIteration, OSError, AttributeError) as e:
+            print(f"::warning::Cannot read METADATA of {whl.name}: {e}")
+        if exists(s3, bucket, key):
+            return whl.name, entry, 0
+        s3.upload_file(str(whl), bucket, key,
+                       ExtraArgs={"ContentType": "application/zip"},
+                       Config=transfer_config())
+        return whl.name, entry, entry["size"]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(put, whls))
+    manifest = {
+        "schema_version": 1,
+        "object_prefix": OBJECT_PREFIX,
+        "wheels": {name: entry for name, entry, _ in results},
+    }
+    # Written last: a manifest only ever names wheels that are in place.
+    s3.put_object(Bucket=bucket, Key=manifest_key,
+                  Body=json.dumps(manifest, indent=2, sort_keys=True).encode(),
+                  ContentType="application/json")
+    uploaded = [n for _, _, n in results if n]
+    return len(uploaded), sum(uploaded)
+
+
 def main() -> int:
     parser = argparse.ArgumentParser()
     parser.add_argument("--source", required=True, type=Path,
@@ -40,6 +186,11 @@ def main() -> int:
     parser.add_argument("--arch", required=True)
     parser.add_argument("--name", required=True,
                         help="Snapshot name, e.g. 'tools', 'deps', 'r2-3'")
+    layout = parser.add_mutually_exclusive_group()
+    layout.add_argument("--tar", action="store_true",
+                        help="Store the snapshot as one tar.zst instead of per-wheel objects.")
+    layout.add_argument("--chunked", action="store_true",
+                        help="Store the snapshot as a tar in the deduplicating chunk store.")
     args = parser.parse_args()
 
     whls = sorted(args.source.glob("*.whl"))
@@ -47,24 +198,45 @@ def main() -> int:
         print(f"No .whl files in {args.source}, skipping upload.")
         return 0
 
-    # Build tar in memory, then compress in one shot.
-    raw = io.BytesIO()
-    with tarfile.open(fileobj=raw, mode="w") as tf:
-        for whl in whls:
-            tf.add(whl, arcname=whl.name)
-    cctx = zstandard.ZstdCompressor()
-    body = cctx.compress(raw.getvalue())
-
     bucket = os.environ["S3_CACHE_BUCKET"]
-    key = f"wheel-snapshots/{args.run_id}/{args.arch}/{args.name}.tar.zst"
+    prefix = f"wheel-snapshots/{args.run_id}/{args.arch}/{args.name}"
+    if args.chunked:
+        key = f"{prefix}{chunkstore.RECIPE_SUFFIX}"
+        s3 = s3_client()
+        try:
+            with chunkstore.producer_pipe(lambda pipe: write_tar(whls, pipe, False)) as pipe:
+                stats = chunkstore.upload_chunked(s3, bucket, pipe, key)
+        except BaseException:
+            # No recipe for a truncated tar; final-test would trip over it.
+            s3.delete_object(Bucket=bucket, Key=key)
+            raise
+        print(f"Uploaded {len(whls)} wheel(s) to s3://{bucket}/{key}: "
+              f"{stats['new_chunks']} of {stats['chunks']} chunk(s) new, "
+              f"{stats['uploaded']} of {stats['size']} bytes sent")
+        return 0
+
     s3 = s3_client()
-    s3.put_object(
-        Bucket=bucket,
-        Key=key,
-        Body=body,
-    )
+    if not args.tar:
+        key = f"{prefix}.manifest.json"
+        count, sent = upload_wheel_objects(s3, bucket, whls, key)
+        print(f"Uploaded snapshot s3://{bucket}/{key}: {len(whls)} wheel(s), "
+              f"{count} new ({sent} bytes sent), {len(whls) - count} already stored")
+        return 0
+
+    key = f"{prefix}.tar.zst"
+    try:
+        with chunkstore.producer_pipe(lambda pipe: write_tar(whls, pipe, True)) as pipe:
+            s3.upload_fileobj(pipe, bucket, key,
+                              ExtraArgs={"ContentType": "application/zstd"},
+                              Config=transfer_config())
+    except BaseException:
+        # A failed producer ends the stream early; don't leave a truncated
+        # snapshot for final-test to trip over.
+        s3.delete_object(Bucket=bucket, Key=key)
+        raise
+    size = s3.head_object(Bucket=bucket, Key=key)["ContentLength"]
     print(f"Uploaded {len(whls)} wheel(s) to s3://{bucket}/{key} "
-          f"({len(body)} bytes)")
+          f"({size} bytes)")
     return 0
 
 
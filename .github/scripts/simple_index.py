@@ -0,0 +1,193 @@
+"""Static PEP 503 / PEP 691 simple index pages for the staging bucket.
+
+Written next to the wheels of a `builds/<run>/` prefix by upload_wheels.py
+and merged into `main/` by promote_wheels.py:
+
+    <prefix>/simple/index.html              # PEP 503 project list
+    <prefix>/simple/index.json              # PEP 691 project list
+    <prefix>/simple/<norm>/index.html       # PEP 503 file links
+    <prefix>/simple/<norm>/index.json       # PEP 691 files
+
+File URLs are relative (`../../<norm>/<wheel>`), so the same pages work
+under any prefix that mirrors the `<norm>/<wheel>` layout. Pointer
+promotions instead write `main/simple/` with URLs into the pointed-at
+`builds/<run>/` prefix (see replace_index). Every file
+carries its sha256, its size and the hash of its PEP 658 `.metadata`
+sidecar, letting pip resolve from METADATA alone. The JSON pages are also
+what promote_wheels.py reads back to merge a promotion into `main/`.
+"""
+
+import html
+import json
+
+from botocore.exceptions import ClientError
+
+JSON_CONTENT_TYPE = "application/vnd.pypi.simple.v1+json"
+HTML_CONTENT_TYPE = "text/html; charset=utf-8"
+API_VERSION = "1.1"
+
+
+def file_entry(norm: str, info: dict, base: str = "../..") -> dict:
+    """PEP 691 file dict for one MANIFEST.json wheel entry; `base` is the
+    wheel prefix relative to the project page."""
+    entry = {
+        "filename": info["filename"],
+        "url": f"{base}/{norm}/{info['filename']}",
+        "hashes": {"sha256": info["sha256"]} if info.get("sha256") else {},
+        "size": info["size"],
+    }
+    if info.get("metadata_sha256"):
+        meta = {"sha256": info["metadata_sha256"]}
+        entry["core-metadata"] = meta
+        entry["dist-info-metadata"] = meta
+    return entry
+
+
+def manifest_projects(manifest: dict, base: str = "../..") -> dict[str, dict[str, dict]]:
+    """{norm: {filename: file entry}} for every wheel in a MANIFEST.json."""
+    return {
+        norm: {info["filename"]: file_entry(norm, info, base) for info in infos}
+        for norm, infos in manifest.get("packages", {}).items()
+    }
+
+
+def project_json(norm: str, files: dict[str, dict], versions: set[str]) -> dict:
+    return {
+        "meta": {"api-version": API_VERSION},
+        "name": norm,
+        "versions": sorted(versions),
+        "files": [files[name] for name in sorted(files)],
+    }
+
+
+def project_html(norm: str, files: dict[str, dict]) -> str:
+    links = []
+    for name in sorted(files):
+        f = files[name]
+        href = f["url"]
+        if "sha256" in f["hashes"]:
+            href += f"#sha256={f['hashes']['sha256']}"
+        attrs = f'href="{html.escape(href)}"'
+        if "core-metadata" in f:
+            meta = f"sha256={f['core-metadata']['sha256']}"
+            attrs += f' data-dist-info-metadata="{meta}" data-core-metadata="{meta}"'
+        links.append(f"    <a {attrs}>{html.escape(name)}</a><br/>")
+    return _page(f"Links for {norm}", links)
+
+
+def root_json(projects: set[str]) -> dict:
+    return {
+        "meta": {"api-version": API_VERSION},
+        "projects": [{"name": norm} for norm in sorted(projects)],
+    }
+
+
+def root_html(projects: set[str]) -> str:
+    return _page("Simple index", [
+        f'    <a href="{html.escape(norm)}/">{html.escape(norm)}</a><br/>'
+        for norm in sorted(projects)
+    ])
+
+
+def _page(title: str, lines: list[str]) -> str:
+    return "\n".join([
+        "<!DOCTYPE html>",
+        "<html>",
+        '  <head><meta name="pypi:repository-version" content="1.1">'
+        f"<title>{html.escape(title)}</title></head>",
+        "  <body>",
+        f"    <h1>{html.escape(title)}</h1>",
+        *lines,
+        "  </body>",
+        "</html>",
+        "",
+    ])
+
+
+def _version_of(filename: str) -> str:
+    return filename.split("-")[1]
+
+
+def load_json(s3, bucket: str, key: str) -> dict | None:
+    try:
+        return json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code", "") in ("NoSuchKey", "404"):
+            return None
+        raise
+
+
+def _put(s3, bucket: str, key: str, body: str, content_type: str) -> None:
+    s3.put_object(Bucket=bucket, Key=key, Body=body.encode("utf-8"),
+                  ContentType=content_type)
+
+
+def write_project(s3, bucket: str, prefix: str, norm: str, files: dict[str, dict]) -> None:
+    versions = {_version_of(name) for name in files}
+    base = f"{prefix}/simple/{norm}"
+    _put(s3, bucket, f"{base}/index.json",
+         json.dumps(project_json(norm, files, versions), indent=1), JSON_CONTENT_TYPE)
+    _put(s3, bucket, f"{base}/index.html", project_html(norm, files), HTML_CONTENT_TYPE)
+
+
+def write_root(s3, bucket: str, prefix: str, projects: set[str]) -> None:
+    _put(s3, bucket, f"{prefix}/simple/index.json",
+         json.dumps(root_json(projects), indent=1), JSON_CONTENT_TYPE)
+    _put(s3, bucket, f"{prefix}/simple/index.html", root_html(projects), HTML_CONTENT_TYPE)
+
+
+def write_index(s3, bucket: str, prefix: str, projects: dict[str, dict[str, dict]],
+                executor=None) -> None:
+    """Write the full index for `projects` under `prefix`, project pages
+    first and the root pages last."""
+    jobs = [(s3, bucket, prefix, norm, files) for norm, files in projects.items()]
+    if executor:
+        list(executor.map(lambda job: write_project(*job), jobs))
+    else:
+        for job in jobs:
+            write_project(*job)
+    write_root(s3, bucket, prefix, set(projects))
+
+
+def merge_index(s3, bucket: str, prefix: str, projects: dict[str, dict[str, dict]],
+                executor=None) -> int:
+    """Merge `projects` into the index already under `prefix`, touching only
+    the projects they name plus the root pages. A filename already listed
+    is replaced. Returns the number of project pages rewritten."""
+    def merge(norm: str, files: dict[str, dict]) -> None:
+        existing = load_json(s3, bucket, f"{prefix}/simple/{norm}/index.json")
+        merged = {f["filename"]: f for f in (existing or {}).get("files", [])}
+        merged.update(files)
+        write_project(s3, bucket, prefix, norm, merged)
+
+    if executor:
+        list(executor.map(lambda item: merge(*item), projects.items()))
+    else:
+        for item in projects.items():
+            merge(*item)
+    root = load_json(s3, bucket, f"{prefix}/simple/index.json") or {}
+    names = {p["name"] for p in root.get("projects", [])} | set(projects)
+    write_root(s3, bucket, prefix, names)
+    return len(projects)
+
+
+def replace_index(s3, bucket: str, prefix: str, projects: dict[str, dict[str, dict]],
+                  executor=None) -> list[str]:
+    """Make the index under `prefix` list exactly `projects`: write them all,
+    then delete the pages of projects no longer listed, since pip requests
+    `simple/<name>/` directly rather than through the root page. Returns
+    the removed project names."""
+    write_index(s3, bucket, prefix, projects, executor)
+    paginator = s3.get_paginator("list_objects_v2")
+    stale = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/simple/", Delimiter="/"):
+        for cp in page.get("CommonPrefixes", []) or []:
+            norm = cp["Prefix"].rstrip("/").rsplit("/", 1)[-1]
+            if norm not in projects:
+                stale.append(norm)
+    for i in range(0, len(stale), 500):
+        s3.delete_objects(Bucket=bucket, Delete={"Objects": [
+            {"Key": f"{prefix}/simple/{norm}/index.{ext}"}
+            for norm in stale[i:i + 500] for ext in ("html", "json")
+        ]})
+    return stale
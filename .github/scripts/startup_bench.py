@@ -0,0 +1,160 @@
+"""Startup and import-time benchmark for the final MonolithPy interpreter.
+
+Fast startup is the point of a statically linked interpreter, so after the
+final rebuild final_test.py measures it:
+
+  startup.warm   `python -c pass`, bytecode caches in place
+  startup.cold   `python -c pass` with PYTHONPYCACHEPREFIX pointing at a
+                 fresh empty directory, so no cached bytecode is found
+  import.<name>  cumulative `-X importtime` of `import <name>` for each
+                 top-level package, plus the slowest modules in its tree
+
+Every measurement is repeated and summarised by median, min and stdev, and
+comparisons use the median. Results are written as JSON; compare() checks
+them against a baseline file in the same format:
+
+    {"repeat": 10, "metrics": {"import.numpy": {"median_ms": ..., ...}}, ...}
+
+A metric regresses when its median exceeds the baseline median by more
+than `tolerance` (a fraction) and by more than NOISE_FLOOR_MS, so tiny
+imports don't fail the job on scheduler jitter.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+NOISE_FLOOR_MS = 5.0
+TREE_TOP = 10
+
+# Resolve import names for distributions inside the interpreter under test:
+# prints {dist_name: [top-level import names]}.
+_IMPORT_NAMES_SCRIPT = """
+import json, re, sys
+from importlib.metadata import packages_distributions
+norm = lambda n: re.sub(r"[-_.]+", "-", n).lower()
+out = {}
+for mod, dists in packages_distributions().items():
+    if mod.startswith("_") or not mod.isidentifier():
+        continue
+    for dist in dists:
+        out.setdefault(norm(dist), []).append(mod)
+json.dump(out, sys.stdout)
+"""
+
+
+def _summary(samples_ms: list[float]) -> dict:
+    return {
+        "median_ms": round(statistics.median(samples_ms), 3),
+        "min_ms": round(min(samples_ms), 3),
+        "stdev_ms": round(statistics.stdev(samples_ms), 3) if len(samples_ms) > 1 else 0.0,
+        "samples": len(samples_ms),
+    }
+
+
+def _time_run(cmd: list[str], env: dict | None = None) -> float:
+    start = time.perf_counter()
+    subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def measure_startup(python: Path, repeat: int) -> dict[str, dict]:
+    cmd = [str(python), "-c", "pass"]
+    _time_run(cmd)  # warm the OS file cache and bytecode caches once
+    warm = [_time_run(cmd) for _ in range(repeat)]
+    cold = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as prefix:
+            cold.append(_time_run(cmd, env={**os.environ, "PYTHONPYCACHEPREFIX": prefix}))
+    return {"startup.warm": _summary(warm), "startup.cold": _summary(cold)}
+
+
+def parse_importtime(stderr: str, module: str) -> tuple[float, list[dict]]:
+    """Return (cumulative ms of `module`, slowest modules by self time)
+    from `-X importtime` output."""
+    total = None
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append({"module": name.strip(), "self_ms": int(self_us) / 1000,
+                     "cumulative_ms": int(cumulative_us) / 1000})
+        if name.strip() == module:
+            total = int(cumulative_us) / 1000
+    if total is None:
+        raise RuntimeError(f"`import {module}` missing from -X importtime output")
+    rows.sort(key=lambda r: r["self_ms"], reverse=True)
+    return total, rows[:TREE_TOP]
+
+
+def resolve_import_names(python: Path, dists: list[str]) -> dict[str, str]:
+    """{dist: import name} for each dist with an importable top-level
+    module, preferring the module named like the distribution."""
+    proc = subprocess.run([str(python), "-c", _IMPORT_NAMES_SCRIPT],
+                          capture_output=True, text=True, check=True)
+    modules = json.loads(proc.stdout)
+    names = {}
+    for dist in dists:
+        candidates = sorted(set(modules.get(dist, [])))
+        if candidates:
+            preferred = dist.replace("-", "_")
+            names[dist] = preferred if preferred in candidates else candidates[0]
+    return names
+
+
+def measure_imports(python: Path, modules: dict[str, str], repeat: int) -> tuple[dict, list[str]]:
+    """Time `import <module>` for each {dist: module}. Returns (metrics,
+    modules that failed to import)."""
+    metrics: dict[str, dict] = {}
+    failed = []
+    for dist, module in sorted(modules.items()):
+        cmd = [str(python), "-X", "importtime", "-c", f"import {module}"]
+        # The first import may write bytecode; it is not a sample.
+        first = subprocess.run(cmd, capture_output=True, text=True)
+        if first.returncode != 0:
+            failed.append(module)
+            continue
+        samples = []
+        tree = []
+        for _ in range(repeat):
+            proc = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            total, tree = parse_importtime(proc.stderr, module)
+            samples.append(total)
+        metrics[f"import.{module}"] = {**_summary(samples), "distribution": dist,
+                                       "slowest_modules": tree}
+    return metrics, failed
+
+
+def run_benchmark(python: Path, dists: list[str], repeat: int) -> dict:
+    modules = resolve_import_names(python, dists)
+    metrics = measure_startup(python, repeat)
+    import_metrics, failed = measure_imports(python, modules, repeat)
+    metrics.update(import_metrics)
+    return {
+        "repeat": repeat,
+        "metrics": metrics,
+        "not_importable": sorted(set(dists) - set(modules)),
+        "import_failed": failed,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Return a description of every metric that regressed past `tolerance`."""
+    regressions = []
+    for name, base in sorted(baseline.get("metrics", {}).items()):
+        current = results["metrics"].get(name)
+        if current is None:
+            continue
+        limit = max(base["median_ms"] * (1 + tolerance), base["median_ms"] + NOISE_FLOOR_MS)
+        if current["median_ms"] > limit:
+            regressions.append(
+                f"{name}: {current['median_ms']:.1f} ms vs baseline "
+                f"{base['median_ms']:.1f} ms (limit {limit:.1f} ms)"
+            )
+    return regressions
@@ -0,0 +1,79 @@
+"""Chrome trace-event timeline for the CI scripts.
+
+Spans are recorded as complete ("X") events and written as a JSON object
+that loads directly in chrome://tracing or https://ui.perfetto.dev:
+
+    import tracing
+    tracing.enable(Path("trace.json"))
+    with tracing.span("run_build", pkg="numpy"):
+        ...
+
+Tracing is off until enable() is called, and span() is then a cheap no-op.
+The file is written at interpreter exit, so a job that bails out with
+sys.exit(1) halfway through still leaves a usable trace. Timestamps are
+wall-clock microseconds, so traces from different jobs of one run line up
+when loaded together.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+_lock = threading.Lock()
+_events: list[dict] = []
+_thread_ids: dict[int, int] = {}
+_path: Path | None = None
+
+
+def enable(path: Path, process_name: str | None = None) -> None:
+    """Start recording spans; they are written to `path` at exit."""
+    global _path
+    if _path is None:
+        atexit.register(write)
+    _path = path
+    if process_name:
+        _events.append({"name": "process_name", "ph": "M", "pid": os.getpid(),
+                        "tid": 0, "args": {"name": process_name}})
+
+
+def _tid() -> int:
+    # Small stable ids keep the viewer's thread lanes readable.
+    ident = threading.get_ident()
+    with _lock:
+        return _thread_ids.setdefault(ident, len(_thread_ids))
+
+
+@contextmanager
+def span(name: str, cat: str = "ci", **args):
+    """Record the duration of the with-block as one event named `name`."""
+    if _path is None:
+        yield
+        return
+    start = time.time_ns() // 1000
+    try:
+        yield
+    finally:
+        event = {
+            "name": name, "cat": cat, "ph": "X",
+            "ts": start, "dur": time.time_ns() // 1000 - start,
+            "pid": os.getpid(), "tid": _tid(),
+        }
+        if args:
+            event["args"] = {k: str(v) for k, v in args.items()}
+        with _lock:
+            _events.append(event)
+
+
+def write() -> None:
+    """Write every recorded event to the enabled trace file."""
+    if _path is None:
+        return
+    with _lock:
+        events = list(_events)
+    _path.parent.mkdir(parents=True, exist_ok=True)
+    _path.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+    print(f"Wrote {len(events)} trace event(s) to {_path}")
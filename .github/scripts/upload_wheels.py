@@ -5,7 +5,14 @@ Layout written under `builds/<run-id>-<sha>/`:
 
     <norm-pkg-name>/<wheel>.whl
     <norm-pkg-name>/<wheel>.whl.metadata   # PEP 658 sidecar (dist-info METADATA)
+    simple/...                             # PEP 503/691 index, see simple_index.py
     MANIFEST.json                          # written last; presence = upload complete
+
+MANIFEST.json records every wheel's sha256 and size. A wheel whose sha256
+matches the newest earlier `builds/` run's MANIFEST.json is server-side
+copied from there along with its sidecar, so a run that changed a single
+package only pushes that package's bytes from the runner (--full-upload
+turns this off).
 """
 
 import argparse
@@ -21,6 +28,9 @@ from pathlib import Path
 
 import boto3
 from botocore.config import Config
+from botocore.exceptions import ClientError
+
+import simple_index
 
 
 _WHEEL_NAME_RE = re.compile(
@@ -101,6 +111,52 @@ def make_s3_client():
     )
 
 
+def sha256_of(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_previous_manifest(s3, bucket: str, exclude: str) -> tuple[str, dict] | None:
+    """Return (prefix, manifest) of the newest complete builds/<run>-<sha>/
+    other than `exclude`, by run number, or None if there is none."""
+    paginator = s3.get_paginator("list_objects_v2")
+    runs = []
+    for page in paginator.paginate(Bucket=bucket, Prefix="builds/", Delimiter="/"):
+        for cp in page.get("CommonPrefixes", []) or []:
+            prefix = cp["Prefix"].rstrip("/")
+            run_number = prefix.rsplit("/", 1)[-1].split("-", 1)[0]
+            if prefix != exclude and run_number.isdigit():
+                runs.append((int(run_number), prefix))
+    for _, prefix in sorted(runs, reverse=True):
+        try:
+            resp = s3.get_object(Bucket=bucket, Key=f"{prefix}/MANIFEST.json")
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code", "") in ("NoSuchKey", "404"):
+                continue  # partial upload
+            raise
+        return prefix, json.loads(resp["Body"].read())
+    return None
+
+
+def previous_wheels(manifest: dict) -> dict[str, dict]:
+    """{filename: manifest entry} for the entries that carry a sha256."""
+    return {
+        info["filename"]: info
+        for infos in manifest.get("packages", {}).values()
+        for info in infos
+        if info.get("sha256")
+    }
+
+
+def copy_from_previous(s3, bucket: str, src_key: str, dst_key: str) -> None:
+    # The managed copy falls back to multipart UploadPartCopy above 5 GB.
+    s3.copy({"Bucket": bucket, "Key": src_key}, bucket, dst_key)
+    print(f"  copied {dst_key} from {src_key}")
+
+
 def upload_wheel(s3, bucket: str, key: str, path: Path) -> None:
     s3.upload_file(
         str(path),
@@ -141,6 +197,9 @@ def main() -> int:
     parser.add_argument("--sha", required=True)
     parser.add_argument("--ref", default="")
     parser.add_argument("--workflow-url", default="")
+    parser.add_argument("--full-upload", action="store_true",
+                        help="Upload every wheel instead of copying unchanged "
+                             "ones from the previous build.")
     args = parser.parse_args()
 
     run_folder = f"{args.run_id}-{args.sha}"
@@ -177,6 +236,15 @@ def main() -> int:
     bucket = os.environ["S3_BUCKET"]
     s3 = make_s3_client()
 
+    base_prefix = None
+    base_wheels: dict[str, dict] = {}
+    if not args.full_upload:
+        previous = load_previous_manifest(s3, bucket, exclude=prefix)
+        if previous:
+            base_prefix, base_manifest = previous
+            base_wheels = previous_wheels(base_manifest)
+            print(f"Comparing against {base_prefix}/ ({len(base_wheels)} hashed wheel(s))")
+
     per_package: dict[str, list[dict]] = {}
 
     def upload_one_wheel(item):
@@ -185,24 +253,48 @@ def main() -> int:
         norm = pep503_normalize(dist_name)
         wheel_key = f"{prefix}/{norm}/{filename}"
         meta_key = f"{wheel_key}.metadata"
-
-        metadata_bytes = extract_metadata_from_wheel(path)
-        upload_wheel(s3, bucket, wheel_key, path)
-        meta_digest = upload_metadata(s3, bucket, meta_key, metadata_bytes)
-
-        return norm, {
+        size = path.stat().st_size
+        digest = sha256_of(path)
+        info = {
             "filename": filename,
             "version": version,
-            "size": path.stat().st_size,
+            "size": size,
+            "sha256": digest,
             "wheel_key": wheel_key,
             "metadata_key": meta_key,
-            "metadata_sha256": meta_digest,
         }
 
+        base = base_wheels.get(filename)
+        if base and base["sha256"] == digest and base["size"] == size:
+            try:
+                copy_from_previous(s3, bucket, base["wheel_key"], wheel_key)
+                copy_from_previous(s3, bucket, base["metadata_key"], meta_key)
+                return norm, dict(info, metadata_sha256=base["metadata_sha256"]), False
+            except ClientError as e:
+                # The previous build may have been pruned since its manifest
+                # was read; fall back to a normal upload.
+                print(f"::warning::Copying {filename} from {base_prefix}/ failed "
+                      f"({e.response.get('Error', {}).get('Code', '')}); uploading it")
+
+        metadata_bytes = extract_metadata_from_wheel(path)
+        upload_wheel(s3, bucket, wheel_key, path)
+        info["metadata_sha256"] = upload_metadata(s3, bucket, meta_key, metadata_bytes)
+        return norm, info, True
+
     print("\nUploading wheels + PEP 658 metadata sidecars...")
+    uploaded = copied = 0
+    uploaded_bytes = copied_bytes = 0
     with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
-        for norm, info in executor.map(upload_one_wheel, wheels.items()):
+        for norm, info, sent in executor.map(upload_one_wheel, wheels.items()):
             per_package.setdefault(norm, []).append(info)
+            if sent:
+                uploaded += 1
+                uploaded_bytes += info["size"]
+            else:
+                copied += 1
+                copied_bytes += info["size"]
+    print(f"\n{uploaded} wheel(s) uploaded ({uploaded_bytes} bytes), "
+          f"{copied} unchanged wheel(s) copied server-side ({copied_bytes} bytes)")
 
     manifest = {
         "schema_version": 1,
@@ -210,6 +302,7 @@ def main() -> int:
         "commit_sha": args.sha,
         "ref": args.ref,
         "workflow_url": args.workflow_url,
+        "base_prefix": base_prefix,
         "uploaded_at": datetime.datetime.now(datetime.timezone.utc)
         .isoformat(timespec="seconds")
         .replace("+00:00", "Z"),
@@ -219,6 +312,12 @@ def main() -> int:
         },
     }
 
+    print("\nWriting PEP 503/691 simple index...")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        simple_index.write_index(s3, bucket, prefix,
+                                 simple_index.manifest_projects(manifest), executor)
+    print(f"  wrote {prefix}/simple/ ({len(per_package)} project(s))")
+
     print("\nUploading MANIFEST.json...")
     upload_manifest(s3, bucket, f"{prefix}/MANIFEST.json", manifest)
 